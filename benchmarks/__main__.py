@@ -0,0 +1,129 @@
+"""
+Benchmark russell against a synthetic site.
+
+    python -m benchmarks --posts 5000 --tags 200 --code-blocks 2
+
+Generates a site, then measures a cold build, a rebuild with nothing changed
+and a rebuild after editing one post, each in a fresh process.
+"""
+
+import argparse
+import json
+import os.path
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.synth import make_site
+
+SCENARIOS = ("cold", "noop", "edit")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_args(args=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--tags", type=int, default=50)
+    parser.add_argument("--tags-per-post", type=int, default=3)
+    parser.add_argument("--paragraphs", type=int, default=5)
+    parser.add_argument("--code-blocks", type=int, default=0)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--assets", type=int, default=20)
+    parser.add_argument("--asset-size", type=int, default=4096)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--render-workers", type=int, default=1)
+    parser.add_argument(
+        "--evict-bodies",
+        action="store_true",
+        help="forget rendered posts once they have been written",
+    )
+    parser.add_argument(
+        "--scenario",
+        choices=SCENARIOS,
+        action="append",
+        help="only run these scenarios (can be given more than once)",
+    )
+    parser.add_argument(
+        "--site-dir",
+        help="generate the site here and keep it, instead of a temporary directory",
+    )
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    return parser.parse_args(args)
+
+
+def run_scenario(site_dir, scenario, render_workers, evict_bodies):
+    cmd = [
+        sys.executable,
+        "-m",
+        "benchmarks.build",
+        site_dir,
+        scenario,
+        str(render_workers),
+        "evict" if evict_bodies else "keep",
+    ]
+    output = subprocess.check_output(cmd, cwd=REPO_ROOT)
+    return json.loads(output)
+
+
+def format_results(results):
+    lines = []
+    for scenario, result in results.items():
+        lines.append(
+            "%-5s %8.3fs %9.1f posts/s %8.1f MB peak RSS %8.1f MB output %6d changed"
+            % (
+                scenario,
+                result["seconds"],
+                result["posts_per_second"],
+                result["peak_rss"] / 1024 / 1024,
+                result["output_bytes"] / 1024 / 1024,
+                result["changed_files"],
+            )
+        )
+        for name, seconds in sorted(
+            result["phases"].items(), key=lambda item: item[1], reverse=True
+        ):
+            lines.append("      %-24s %8.3fs" % (name, seconds))
+    return "\n".join(lines)
+
+
+def run(args, site_dir):
+    make_site(
+        site_dir,
+        posts=args.posts,
+        tags=args.tags,
+        tags_per_post=args.tags_per_post,
+        paragraphs=args.paragraphs,
+        code_blocks=args.code_blocks,
+        pages=args.pages,
+        assets=args.assets,
+        asset_size=args.asset_size,
+        seed=args.seed,
+    )
+    # later scenarios rebuild on top of the cold build
+    scenarios = [s for s in SCENARIOS if s in (args.scenario or SCENARIOS)]
+    if scenarios[0] != "cold":
+        run_scenario(site_dir, "cold", args.render_workers, args.evict_bodies)
+    return {
+        scenario: run_scenario(
+            site_dir, scenario, args.render_workers, args.evict_bodies
+        )
+        for scenario in scenarios
+    }
+
+
+def main(args=None):
+    args = get_args(args)
+    if args.site_dir:
+        results = run(args, args.site_dir)
+    else:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results = run(args, os.path.join(tmpdir, "site"))
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        print(format_results(results))
+
+
+if __name__ == "__main__":
+    main()
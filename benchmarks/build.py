@@ -0,0 +1,121 @@
+"""
+Build a synthetic site once, and print measurements of the build as JSON.
+
+This is run in a subprocess for every scenario, so that the peak memory use
+reported is that of a single build.
+"""
+
+import json
+import os
+import os.path
+import resource
+import sys
+import tempfile
+import time
+
+import russell
+
+# the same pipeline as the example site, minus sass
+PHASES = (
+    ("copy_assets", {}),
+    ("add_asset_hashes", {}),
+    ("generate_index", {"num_posts": 3}),
+    ("generate_archive", {}),
+    ("generate_pages", {}),
+    ("generate_posts", {}),
+    ("generate_tags", {}),
+    ("generate_sitemap", {}),
+    ("generate_feeds", {}),
+)
+
+
+def get_peak_rss():
+    """
+    Get the peak resident set size of this process, in bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macos bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def get_dir_size(path):
+    """
+    Get the total size of the files in a directory.
+    """
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            total += os.path.getsize(os.path.join(dirpath, filename))
+    return total
+
+
+def touch_post(root_path, idx=0):
+    """
+    Append a line to a post, as if it was edited.
+    """
+    path = os.path.join(root_path, "posts", "post-%d.md" % idx)
+    with open(path, "a") as file:
+        file.write("\nEdited at %f.\n" % time.time())
+
+
+def build(root_path, full=False, render_workers=None, evict_bodies=False):
+    """
+    Build the site in root_path with the full pipeline, and return a dict of
+    measurements.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        profile_path = os.path.join(tmpdir, "profile.json")
+        start = time.perf_counter()
+        blog = russell.BlogEngine(
+            root_path=root_path,
+            root_url="https://example.com",
+            site_title="Benchmark",
+            cache_dir=".russell-cache",
+            full_build=full,
+            render_workers=render_workers,
+            evict_bodies=evict_bodies,
+            profile=profile_path,
+        )
+        blog.add_pages()
+        blog.add_posts()
+        for method, kwargs in PHASES:
+            getattr(blog, method)(**kwargs)
+        blog.write_file("robots.txt", "User-agent: *\nDisallow:\n")
+        diff = blog.finish(prune=True)
+        seconds = time.perf_counter() - start
+        with open(profile_path) as file:
+            profile = json.load(file)
+
+    return {
+        "seconds": round(seconds, 3),
+        "posts": len(blog.posts),
+        "posts_per_second": round(len(blog.posts) / seconds, 1),
+        "peak_rss": get_peak_rss(),
+        "output_bytes": get_dir_size(os.path.join(root_path, "dist")),
+        "changed_files": sum(len(files) for files in diff.values()),
+        "phases": {
+            name: timing["seconds"] for name, timing in profile["phases"].items()
+        },
+        "timers": {
+            name: timing["seconds"] for name, timing in profile["timers"].items()
+        },
+    }
+
+
+def main():
+    root_path, scenario = sys.argv[1], sys.argv[2]
+    render_workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    evict_bodies = len(sys.argv) > 4 and sys.argv[4] == "evict"
+    if scenario == "edit":
+        touch_post(root_path)
+    result = build(
+        root_path,
+        full=scenario == "cold",
+        render_workers=render_workers,
+        evict_bodies=evict_bodies,
+    )
+    json.dump(result, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Generate synthetic russell sites of any size, using the templates of the
+example site, for benchmarking.
+"""
+
+import datetime
+import os
+import os.path
+import random
+import shutil
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "example")
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam "
+    "quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo "
+    "consequat duis aute irure in reprehenderit voluptate velit esse cillum"
+).split()
+
+CODE_BLOCK = """```python
+def fib(n):
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+```"""
+
+
+def _sentence(rng, num_words):
+    words = [rng.choice(WORDS) for _ in range(num_words)]
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rng, num_sentences=5):
+    return " ".join(_sentence(rng, rng.randint(6, 16)) for _ in range(num_sentences))
+
+
+def make_post(rng, idx, tags, paragraphs=5, code_blocks=0, pubdate=None):
+    """
+    Make the markdown of a post.
+    """
+    pubdate = pubdate or datetime.datetime(2010, 1, 1) + datetime.timedelta(
+        hours=idx * 7
+    )
+    parts = [_paragraph(rng) for _ in range(paragraphs)]
+    for block in range(code_blocks):
+        parts.insert(min(len(parts), 1 + block * 2), CODE_BLOCK)
+    header = "# Post number %d: %s\npubdate: %s UTC\ntags: %s\n" % (
+        idx,
+        _sentence(rng, 4)[:-1],
+        pubdate.strftime("%Y-%m-%d %H:%M"),
+        ", ".join(tags),
+    )
+    return header + "\n" + "\n\n".join(parts) + "\n"
+
+
+def make_site(
+    root,
+    posts=1000,
+    tags=50,
+    tags_per_post=3,
+    paragraphs=5,
+    code_blocks=0,
+    pages=10,
+    assets=20,
+    asset_size=4096,
+    seed=0,
+):
+    """
+    Create a site in a directory, which must not already exist.
+
+    Args:
+      root (str): The directory to create the site in.
+      posts (int): Number of posts.
+      tags (int): Number of distinct tags.
+      tags_per_post (int): Number of tags on each post.
+      paragraphs (int): Number of paragraphs in the body of each post.
+      code_blocks (int): Number of fenced code blocks in each post.
+      pages (int): Number of pages.
+      assets (int): Number of asset files, besides style.css.
+      asset_size (int): Size of each asset file, in bytes.
+      seed (int): Seed for the random contents, so sites are reproducible.
+    """
+    rng = random.Random(seed)
+    os.makedirs(root)
+    shutil.copytree(
+        os.path.join(EXAMPLE_DIR, "templates"), os.path.join(root, "templates")
+    )
+
+    tag_names = ["Tag %d" % idx for idx in range(tags)]
+    posts_dir = os.path.join(root, "posts")
+    os.makedirs(posts_dir)
+    for idx in range(posts):
+        post_tags = rng.sample(tag_names, min(tags_per_post, len(tag_names)))
+        contents = make_post(rng, idx, post_tags, paragraphs, code_blocks)
+        with open(os.path.join(posts_dir, "post-%d.md" % idx), "w") as file:
+            file.write(contents)
+
+    pages_dir = os.path.join(root, "pages")
+    os.makedirs(pages_dir)
+    for idx in range(pages):
+        with open(os.path.join(pages_dir, "page-%d.md" % idx), "w") as file:
+            file.write("# Page %d\n\n%s\n" % (idx, _paragraph(rng)))
+
+    assets_dir = os.path.join(root, "assets")
+    os.makedirs(os.path.join(assets_dir, "img"))
+    with open(os.path.join(assets_dir, "style.css"), "w") as file:
+        file.write("body { font-family: sans-serif; }\n")
+    for idx in range(assets):
+        with open(os.path.join(assets_dir, "img", "%d.bin" % idx), "wb") as file:
+            file.write(rng.randbytes(asset_size))
@@ -16,6 +16,11 @@ blog = russell.BlogEngine(
     root_url=args.root_url or "//localhost",
     site_title="Russell example",
     site_desc=("An example Russell site."),
+    cache_dir=".russell-cache",
+    full_build=args.full,
+    profile=args.profile,
+    cprofile=args.cprofile,
+    template_cache=True,
 )
 
 # add content
@@ -24,12 +29,14 @@ blog.add_posts()
 
 
 def generate():
+    # find errors in templates before generating anything
+    blog.precompile_templates()
+
     # copy and generate assets
     blog.copy_assets()
-    blog.write_file(
-        "assets/style.css",
-        sass.compile(filename=os.path.join(blog.root_path, "style.sass")),
-    )
+    with blog.profiler.phase("sass"):
+        css = sass.compile(filename=os.path.join(blog.root_path, "style.sass"))
+    blog.write_file("assets/style.css", css)
     blog.add_asset_hashes()
 
     # generate HTML pages
@@ -43,3 +50,7 @@ def generate():
     blog.generate_sitemap(https=False)
     blog.generate_rss()
     blog.write_file("robots.txt", "User-agent: *\nDisallow:\n")
+
+    # save the build cache for next time, and remove files from dist that are
+    # no longer generated
+    blog.finish(prune=True)
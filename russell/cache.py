@@ -0,0 +1,230 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import os.path
+
+LOG = logging.getLogger(__name__)
+
+# bump this whenever the structure of what gets cached changes, so that stale
+# caches from older versions of russell are ignored rather than misread.
+CACHE_VERSION = 1
+
+
+def digest(*parts):
+    """
+    Get a hex digest of one or more strings or bytes.
+    """
+    hasher = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        hasher.update(part)
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+def hash_file(path, algorithm="sha1", digest_size=None, chunk_size=1024 * 1024):
+    """
+    Get the hex digest of a file's contents, reading it in chunks so that
+    large files don't have to fit in memory.
+
+    Args:
+      path (str): Path of the file.
+      algorithm (str): Any algorithm supported by hashlib.new.
+      digest_size (int): Optional digest size in bytes, for algorithms which
+        support it, like blake2b.
+    """
+    if digest_size:
+        hasher = hashlib.new(algorithm, digest_size=digest_size)
+    else:
+        hasher = hashlib.new(algorithm)
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def fingerprint(value):
+    """
+    Get a string which will change if the value changes, to be used in cache
+    keys. Returns None if the value is of a type we don't know how to
+    fingerprint, in which case it should not be cached at all.
+
+    Content objects are fingerprinted through their own `fingerprint`
+    attribute.
+    """
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return repr(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if hasattr(value, "fingerprint"):
+        return value.fingerprint
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = value
+        if isinstance(value, (set, frozenset)):
+            items = sorted(value, key=repr)
+        parts = [fingerprint(item) for item in items]
+        if None in parts:
+            return None
+        return "[%s]" % ",".join(parts)
+    if isinstance(value, dict):
+        parts = []
+        for key in sorted(value, key=str):
+            part = fingerprint(value[key])
+            if part is None:
+                return None
+            parts.append("%s=%s" % (key, part))
+        return "{%s}" % ",".join(parts)
+    return None
+
+
+class BuildCache:
+    """
+    A simple persistent key/value store, divided into sections, that survives
+    between builds. Values must be JSON serializable.
+
+    Entries in a section that has been used during a build, but which were not
+    themselves looked up or set, are dropped when the cache is saved, which
+    keeps the cache from growing forever as content is removed or changed.
+
+    Sections with large values can be stored as one file per entry instead,
+    next to the cache file, so that their values are only read when they are
+    looked up and are never all held in memory at once.
+    """
+
+    def __init__(self, path=None, full=False, file_sections=()):
+        """
+        Constructor.
+
+        Args:
+          path (str): Where to store the cache. If None, the cache only lives
+            in memory for as long as the process does.
+          full (bool): If True, ignore any existing cache on disk. The cache
+            will still be filled and saved, so the next build can use it.
+          file_sections (iterable): Names of sections to store as one file per
+            entry. Their keys must be hex digests. Ignored if path is None.
+        """
+        self.path = path
+        self.full = full
+        self._data = {}
+        self._used = {}
+        self._file_sections = set(file_sections) if path else set()
+        # file sections whose files from previous builds are ignored, and the
+        # keys written to each file section during this build
+        self._ignored_files = set(self._file_sections) if full else set()
+        self._written_files = {section: set() for section in self._file_sections}
+        if path and not full:
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as file:
+                data = json.load(file)
+        except ValueError:
+            LOG.warning("could not read build cache %r, ignoring it", self.path)
+            return
+        if data.get("version") != CACHE_VERSION:
+            LOG.info("build cache %r is from another version, ignoring it", self.path)
+            return
+        self._data = data.get("sections", {})
+        LOG.debug("loaded build cache from %r", self.path)
+
+    def get(self, section, key, default=None):
+        self._used.setdefault(section, set()).add(key)
+        if section in self._file_sections:
+            return self._read_file(section, key, default)
+        return self._data.get(section, {}).get(key, default)
+
+    def set(self, section, key, value):
+        self._used.setdefault(section, set()).add(key)
+        if section in self._file_sections:
+            self._write_file(section, key, value)
+        else:
+            self._data.setdefault(section, {})[key] = value
+
+    def keep(self, section, key):
+        """
+        Mark an entry as used without looking it up, so that it isn't dropped
+        when the cache is saved.
+        """
+        self._used.setdefault(section, set()).add(key)
+
+    def _get_file_path(self, section, key):
+        return os.path.join(os.path.dirname(self.path), section, key[:2], key[2:])
+
+    def _read_file(self, section, key, default):
+        if section in self._ignored_files and key not in self._written_files[section]:
+            return default
+        try:
+            with open(self._get_file_path(section, key), "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return default
+
+    def _write_file(self, section, key, value):
+        path = self._get_file_path(section, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(value, file)
+        os.replace(tmp_path, path)
+        self._written_files[section].add(key)
+
+    def clear(self, section=None):
+        """
+        Forget everything in a section, or in the whole cache.
+        """
+        sections = self._file_sections if section is None else {section}
+        for file_section in sections & self._file_sections:
+            self._ignored_files.add(file_section)
+            self._written_files[file_section].clear()
+        if section is None:
+            self._data.clear()
+        else:
+            self._data.pop(section, None)
+
+    def save(self):
+        """
+        Write the cache to disk, if it has a path.
+        """
+        if not self.path:
+            return
+
+        sections = {}
+        for section, entries in self._data.items():
+            used = self._used.get(section)
+            if used is not None:
+                entries = {key: val for key, val in entries.items() if key in used}
+            sections[section] = entries
+
+        cache_dir = os.path.dirname(self.path)
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"version": CACHE_VERSION, "sections": sections}, file)
+        os.replace(tmp_path, self.path)
+        for section in self._file_sections:
+            self._prune_files(section)
+        LOG.debug("saved build cache to %r", self.path)
+
+    def _prune_files(self, section):
+        used = self._used.get(section)
+        if used is None:
+            return
+        if section in self._ignored_files:
+            used = used & self._written_files[section]
+        section_dir = os.path.join(os.path.dirname(self.path), section)
+        if not os.path.isdir(section_dir):
+            return
+        for prefix in os.listdir(section_dir):
+            prefix_dir = os.path.join(section_dir, prefix)
+            for name in os.listdir(prefix_dir):
+                if prefix + name not in used:
+                    os.remove(os.path.join(prefix_dir, name))
+            if not os.listdir(prefix_dir):
+                os.rmdir(prefix_dir)
@@ -9,6 +9,9 @@ import os.path
 import re
 import shutil
 import subprocess
+import threading
+import time
+import traceback
 
 import dateutil.tz
 import slugify
@@ -118,6 +121,8 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
 
     def translate_path(self, path):
         path = super().translate_path(path)
+        if os.path.isfile(path):
+            return path
         try_paths = []
 
         directory, filename = path.rsplit("/", maxsplit=1)
@@ -140,7 +145,75 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         return path
 
 
-def serve(dist_dir):
+def _snapshot(dirs):
+    """
+    Get the modification time and size of every file in some directories.
+    """
+    snapshot = {}
+    for directory in dirs:
+        for root, _, files in os.walk(directory):
+            for file in files:
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def _find_engine(russell_config):
+    # imported here to avoid a circular import, as russell.engine is what
+    # russell/__init__.py imports first
+    from russell.engine import BlogEngine
+
+    for value in vars(russell_config).values():
+        if isinstance(value, BlogEngine):
+            return value
+    raise RuntimeError("could not find a BlogEngine in config.py")
+
+
+def watch(interval=0.5):
+    """
+    Generate the blog, then keep polling its source directories for changes,
+    regenerating whatever is affected. The blog engine is kept in memory
+    between runs, so only changed posts and pages are re-read. The generate
+    function in config.py runs again, but pages and feeds which reload()
+    found to be unaffected by the changes are skipped without being rendered
+    or even checked against the build cache.
+    """
+    russell_config = load_config_py()
+    blog = _find_engine(russell_config)
+    russell_config.generate()
+
+    snapshot = _snapshot(blog.source_dirs)
+    print("Watching for changes in", ", ".join(blog.source_dirs))
+    while True:
+        time.sleep(interval)
+        new_snapshot = _snapshot(blog.source_dirs)
+        changed = {
+            path
+            for path in snapshot.keys() | new_snapshot.keys()
+            if snapshot.get(path) != new_snapshot.get(path)
+        }
+        snapshot = new_snapshot
+        if not changed:
+            continue
+
+        start = time.monotonic()
+        try:
+            dirty = blog.reload(changed)
+            russell_config.generate()
+        except Exception:  # pylint: disable=broad-except
+            traceback.print_exc()
+            continue
+        print(
+            "Regenerated after %d changed file(s), affecting %d output(s), in %.0f ms"
+            % (len(changed), len(dirty), (time.monotonic() - start) * 1000)
+        )
+
+
+def serve(dist_dir, watch_changes=False):
     try:
         httpd = http.server.HTTPServer(
             ("127.0.0.1", 8000),
@@ -148,13 +221,34 @@ def serve(dist_dir):
         )
         sa = httpd.socket.getsockname()
         print("Serving HTTP on http://%s:%s/ ..." % sa)
-        httpd.serve_forever()
+        if watch_changes:
+            threading.Thread(target=httpd.serve_forever, daemon=True).start()
+            watch()
+        else:
+            httpd.serve_forever()
     except KeyboardInterrupt:
         pass
     finally:
         httpd.server_close()
 
 
+def _add_generate_arguments(parser):
+    parser.add_argument("--root-url")
+    parser.add_argument(
+        "--full", action="store_true", default=False, help="ignore the build cache"
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=True,
+        metavar="JSON_FILE",
+        help="time the build and print a summary, or save it as JSON",
+    )
+    parser.add_argument(
+        "--cprofile", metavar="FILE", help="save a cProfile of the build to FILE"
+    )
+
+
 def get_parser():
     parser = argparse.ArgumentParser("russell")
     parser.add_argument("-v", "--verbose", action="store_true")
@@ -184,12 +278,21 @@ def get_parser():
     )
 
     generate_parser = cmd_subparsers.add_parser("generate")
-    generate_parser.add_argument("--root-url")
+    _add_generate_arguments(generate_parser)
 
     serve_parser = cmd_subparsers.add_parser("serve")
+    # serve --watch generates the blog, so config.py may need these
+    _add_generate_arguments(serve_parser)
     serve_parser.add_argument(
         "-d", "--dist-dir", default=os.path.join(os.getcwd(), "dist")
     )
+    serve_parser.add_argument(
+        "-w",
+        "--watch",
+        action="store_true",
+        default=False,
+        help="regenerate the blog when files change",
+    )
 
     return parser
 
@@ -232,7 +335,7 @@ def main(args=None):
     if args.command == "generate":
         return generate()
     if args.command == "serve":
-        return serve(os.path.join(os.getcwd(), "dist"))
+        return serve(args.dist_dir, watch_changes=args.watch)
 
 
 if __name__ == "__main__":
@@ -1,22 +1,88 @@
 from datetime import datetime
+import collections
+import concurrent.futures
+import functools
 import logging
+import multiprocessing
 import os.path
 import re
+import sys
+import threading
 
 import dateutil.parser
 import dateutil.tz
 import markdown
 import slugify
 
+from russell.cache import digest
+from russell.profiling import BuildProfiler
+
 LOG = logging.getLogger(__name__)
 SYSTEM_TZINFO = dateutil.tz.tzlocal()
 
 
-md = markdown.Markdown(extensions=["markdown.extensions.fenced_code"])
+MARKDOWN_EXTENSIONS = ["markdown.extensions.fenced_code"]
+
+# Markdown instances keep state while converting, so they can't be shared
+# between threads. each thread (and each process) gets its own instance.
+_markdown_local = threading.local()
+
+
+def _get_markdown():
+    if not hasattr(_markdown_local, "md"):
+        _markdown_local.md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    return _markdown_local.md
+
+
+def get_markdown_cache_key(text):
+    """
+    Get the build cache key of rendered markdown. Besides the text, the result
+    depends on the markdown extensions used and the version of the library.
+    """
+    extensions = ",".join(
+        ext if isinstance(ext, str) else type(ext).__qualname__
+        for ext in MARKDOWN_EXTENSIONS
+    )
+    return digest(markdown.__version__, extensions, text)
 
 
 def render_markdown(text):
-    return md.convert(text)
+    return _get_markdown().convert(text)
+
+
+def can_fork():
+    """
+    Check if it is safe to render in forked worker processes. Forking is only
+    reliable on Linux (macOS no longer defaults to it, as system libraries
+    may crash in the child), and not while other threads are running, like
+    the HTTP server of `russell serve --watch`, as the child could deadlock
+    on a lock held by one of them.
+    """
+    return sys.platform.startswith("linux") and threading.active_count() == 1
+
+
+def render_markdown_many(texts, workers=None):
+    """
+    Render a list of markdown strings to HTML, spread across a pool of
+    processes, or threads where forking isn't safe (see can_fork).
+
+    Args:
+      texts (list): The markdown strings to render.
+      workers (int): How many processes to use. Defaults to the number of CPUs.
+
+    Returns a list of HTML strings in the same order as the input.
+    """
+    if len(texts) < 2:
+        return [render_markdown(text) for text in texts]
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(texts) // (workers * 4))
+    if not can_fork():
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(render_markdown, texts))
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("fork")
+    ) as pool:
+        return list(pool.map(render_markdown, texts, chunksize=chunksize))
 
 
 def schema_url(url, https=False):
@@ -48,6 +114,73 @@ def _get_description(body, max_chars, search=". "):
     return body[0 : stop_idx + 1]
 
 
+def _parse_pubdate(pubdate_str):
+    # dateutil is slow, so try the most common formats first
+    try:
+        if pubdate_str.endswith(" UTC"):
+            return datetime.fromisoformat(pubdate_str[:-4]).replace(
+                tzinfo=dateutil.tz.UTC
+            )
+        return datetime.fromisoformat(pubdate_str)
+    except ValueError:
+        return dateutil.parser.parse(pubdate_str)
+
+
+def read_header(path):
+    """
+    Read the header lines of a markdown file, up to the first blank line,
+    without reading the rest of the file.
+    """
+    lines = []
+    # reading bytes and only decoding the header is much faster than letting
+    # a text file decode everything it buffers
+    with open(path, "rb") as file:
+        for line in file:
+            line = line.rstrip(b"\r\n")
+            if not line:
+                break
+            lines.append(line.decode("utf-8"))
+    return lines
+
+
+# the metadata of a post or page, read from the header of its file only. see
+# Entry.scan_file.
+EntryHeader = collections.namedtuple(
+    "EntryHeader", ("path", "mtime", "title", "slug", "pubdate", "tags", "public")
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_header_parser(cls):
+    # making Tag objects is slow and registers them with the content manager,
+    # neither of which we want when only scanning headers, so parse them with
+    # a subclass which keeps tag names as they are
+    return type(
+        cls.__name__, (cls,), {"__slots__": (), "make_tag": staticmethod(str.strip)}
+    )
+
+
+def _render_entries(entries, render_many, workers=None):
+    unrendered = [
+        (entry, attr, text)
+        for entry in entries
+        for attr, text in entry.get_unrendered()
+    ]
+    if not unrendered:
+        return
+    htmls = render_many([text for _, _, text in unrendered], workers=workers)
+    for (entry, attr, _), html in zip(unrendered, htmls):
+        setattr(entry, attr, html)
+
+
+def render_entries(entries, workers=None):
+    """
+    Render the markdown of entries that hasn't been rendered yet, spread
+    across a pool of processes. See render_markdown_many.
+    """
+    _render_entries(entries, render_markdown_many, workers=workers)
+
+
 # TODO: surely there's something in stdlib for this
 def _str_to_bool(string):
     norm_string = str(string).strip().lower()
@@ -64,6 +197,10 @@ class Content:
     anything with a URL).
     """
 
+    # content objects are slotted to keep their memory footprint small on
+    # large sites. subclasses should define __slots__ as well.
+    __slots__ = ()
+
     # this property allows us to use the root url as well as other nice
     # things. it's not clean design, it's a circular dependency type of
     # situation, but it makes things very convenient. the property is set
@@ -82,35 +219,152 @@ class Entry(Content):
     Abstract class for text content.
     """
 
+    __slots__ = (
+        "title",
+        "_body",
+        "markdown",
+        "slug",
+        "subtitle",
+        "_description",
+        "public",
+        "source_hash",
+        "source_path",
+        "_url",
+    )
+
     def __init__(
-        self, title, body, slug=None, subtitle=None, description=None, public=True
+        self,
+        title,
+        body=None,
+        slug=None,
+        subtitle=None,
+        description=None,
+        public=True,
+        source_hash=None,
+        source_path=None,
+        markdown=None,
     ):
         """
         Constructor.
         Args:
           title (str): Title.
-          body (str): Markdown body of the entry.
+          body (str): HTML body of the entry.
           slug (str): Optional slug for the entry. If not provided, sulg will be
             guessed based on the title.
           subtitle (str): Optional subtitle.
           description (str): Optional description/excerpt. Mostly used for
-            <meta> tags.
+            <meta> tags. Defaults to the first sentences of the markdown body.
           public (bool): Whether the entry should be public or not. Usually this
             defines whether the entry shows up in the front page, archive pages
             etc., but even private entries are publicly accessable if you know
             the URL.
+          source_hash (str): Optional hash of the markdown the entry was
+            created from. Used by the build cache.
+          source_path (str): Optional path of the file the entry was created
+            from.
+          markdown (str): Optional markdown body of the entry. If body is not
+            given, it is rendered from this the first time it is needed.
         """
         self.title = title
-        self.body = body
+        self._body = body
+        self.markdown = markdown
         self.slug = slug or slugify.slugify(title)
         self.subtitle = subtitle
-        self.description = description
+        self._description = description
         self.public = public
+        self.source_hash = source_hash
+        self.source_path = source_path
+        self._url = None
 
     @property
-    def url(self):
+    def body(self):
+        """
+        The HTML body of the entry. Rendered from markdown on first access, so
+        that outputs which only need an entry's metadata, like sitemaps, don't
+        pay for rendering it.
+        """
+        if self._body is None and self.markdown is not None:
+            self._body = self.render_markdown(self.markdown)
+        return self._body
+
+    @body.setter
+    def body(self, body):
+        self._body = body
+
+    @property
+    def description(self):
+        # derived from the body rather than stored, to save memory
+        if self._description is None and self.markdown is not None:
+            return _get_description(_get_excerpt(self.markdown), 160)
+        return self._description
+
+    @description.setter
+    def description(self, description):
+        self._description = description
+
+    def get_unrendered(self):
+        """
+        Get (attribute, markdown) tuples for the HTML of the entry which has
+        not been rendered yet.
+        """
+        if self._body is None and self.markdown is not None:
+            return [("body", self.markdown)]
+        return []
+
+    def evict(self):
+        """
+        Forget the rendered HTML of the entry, to save memory once it is no
+        longer needed. It will be rendered again if it is used. Does nothing if
+        the entry has no markdown to render it from.
+        """
+        if self.markdown is not None:
+            self._body = None
+
+    def _get_url(self):
         return self.root_url + "/" + self.slug
 
+    @property
+    def url(self):
+        # listings ask for the URL of the same entry many times per build, so
+        # it is memoized along with the root_url and slug it was made from
+        root_url = self.root_url
+        memo = self._url
+        if memo is None or memo[0] != root_url or memo[1] != self.slug:
+            memo = self._url = (root_url, self.slug, self._get_url())
+        return memo[2]
+
+    @property
+    def fingerprint(self):
+        """
+        A string which changes whenever the entry does, used by the build cache
+        to tell whether output containing the entry has to be regenerated. None
+        if the entry was not created from markdown, as we can't tell if it
+        changed.
+        """
+        if self.source_hash is None:
+            return None
+        return "%s:%s:%s" % (self.source_hash, self.slug, self.public)
+
+    @classmethod
+    def render_markdown(cls, text):
+        """
+        Render markdown to HTML, through the content manager if possible so
+        that previously rendered markdown can be re-used.
+        """
+        if cls.cm:
+            return cls.cm.render_markdown(text)
+        return render_markdown(text)
+
+    @classmethod
+    def render_markdown_many(cls, texts, workers=None):
+        """
+        Render many markdown strings to HTML in parallel. See
+        render_markdown_many.
+        """
+        if cls.cm:
+            return cls.cm.render_markdown_many(texts, workers=workers)
+        return render_markdown_many(texts, workers=workers)
+
     @classmethod
     def from_string(cls, contents, **kwargs):
         """
@@ -119,13 +373,42 @@ class Entry(Content):
         Usually subclasses will want to customize the parts of the markdown
         where you provide values for attributes like public - this can be done
         by overriding the process_meta method.
+
+        The markdown is not rendered to HTML until the entry's body is used.
+        """
+        return cls(**cls.parse_string(contents, **kwargs))
+
+    @classmethod
+    def parse_string(cls, contents, **kwargs):
+        """
+        Given a markdown string, get the kwargs to pass to the constructor,
+        without rendering anything to HTML.
         """
         lines = contents.splitlines()
+        try:
+            header_end = lines.index("")
+        except ValueError:
+            header_end = len(lines)
+        title, description = cls.parse_header(lines[:header_end], kwargs)
+
+        # the only lines left should be the actual contents
+        body = "\n".join(lines[header_end + 1 :]).strip()
+        kwargs["source_hash"] = digest(contents)
+
+        kwargs.update(title=title, markdown=body, description=description)
+        return kwargs
+
+    @classmethod
+    def parse_header(cls, lines, kwargs):
+        """
+        Parse the header lines of a markdown string, which come before the
+        first blank line. Constructor kwargs found are added to kwargs.
+
+        Returns a (title, description) tuple, either of which may be None.
+        """
         title = None
         description = None
-
-        line = lines.pop(0)
-        while line != "":
+        for line in lines:
             if not title and line.startswith("#"):
                 title = line[1:].strip()
             elif line.startswith("title:"):
@@ -141,19 +424,7 @@ class Entry(Content):
                     LOG.warning("invalid boolean value for comments", exc_info=True)
 
             cls.process_meta(line, kwargs)
-
-            line = lines.pop(0)
-
-        # the only lines left should be the actual contents
-        body = "\n".join(lines).strip()
-        excerpt = _get_excerpt(body)
-        if description is None:
-            description = _get_description(excerpt, 160)
-        if issubclass(cls, Post):
-            kwargs["excerpt"] = render_markdown(excerpt)
-        body = render_markdown(body)
-
-        return cls(title=title, body=body, description=description, **kwargs)
+        return title, description
 
     @classmethod
     def process_meta(cls, line, kwargs):
@@ -183,10 +454,65 @@ class Entry(Content):
     @classmethod
     def from_file(cls, path, **kwargs):
         """
-        Given a markdown file, get an Entry object.
+        Given a markdown file, get an Entry object. See from_string.
         """
         LOG.debug('creating %s from "%s"', cls, path)
+        return cls(**cls.parse_file(path, **kwargs))
 
+    @classmethod
+    def from_files(cls, files, workers=None):
+        """
+        Given a list of markdown files, get a list of Entry objects. Files are
+        read and their metadata parsed in this process, but rendering the
+        markdown is spread across a pool of processes. Unlike from_file, the
+        markdown is rendered up front.
+
+        Args:
+          files (list): A list of (path, kwargs) tuples.
+          workers (int): How many processes to use. Defaults to the number of
+            CPUs.
+        """
+        entries = [cls.from_file(path, **kwargs) for path, kwargs in files]
+        if cls.cm:
+            cls.cm.render_entries(entries, workers=workers)
+        else:
+            render_entries(entries, workers=workers)
+        return entries
+
+    @classmethod
+    def parse_file(cls, path, **kwargs):
+        """
+        Given a markdown file, get the kwargs to pass to the constructor. See
+        parse_string.
+        """
+        kwargs = cls._get_file_kwargs(path, kwargs)
+        with open(path, "r") as file:
+            return cls.parse_string(file.read(), **kwargs)
+
+    @classmethod
+    def scan_file(cls, path, **kwargs):
+        """
+        Get the metadata of a markdown file as an EntryHeader, reading only
+        its header. Much faster than from_file, as the rest of the file is
+        neither read nor rendered. Tags are not registered with the content
+        manager.
+        """
+        stat = os.stat(path)
+        kwargs = cls._get_file_kwargs(path, kwargs, stat)
+        title, _ = _get_header_parser(cls).parse_header(read_header(path), kwargs)
+        return EntryHeader(
+            path=path,
+            mtime=stat.st_mtime_ns,
+            title=title,
+            slug=kwargs.get("slug") or slugify.slugify(title),
+            pubdate=kwargs.get("pubdate"),
+            tags=tuple(kwargs.get("tags", ())),
+            public=kwargs.get("public", True),
+        )
+
+    @classmethod
+    def _get_file_kwargs(cls, path, kwargs, stat=None):
+        kwargs["source_path"] = path
         # the filename will be the default slug - can be overridden later
         kwargs["slug"] = os.path.splitext(os.path.basename(path))[0]
 
@@ -200,13 +526,10 @@ class Entry(Content):
             # the creation date. this lets you set a post's pubdate by running
             # the command `touch`. we support this behaviour by simply finding
             # the chronologically earliest date of creation and modification.
-            timestamp = min(os.path.getctime(path), os.path.getmtime(path))
+            stat = stat or os.stat(path)
+            timestamp = min(stat.st_ctime, stat.st_mtime)
             kwargs["pubdate"] = datetime.fromtimestamp(timestamp)
-
-        with open(path, "r") as file:
-            entry = cls.from_string(file.read(), **kwargs)
-
-        return entry
+        return kwargs
 
     def __lt__(self, other):
         """
@@ -216,6 +539,8 @@ class Entry(Content):
 
 
 class Page(Entry):
+    __slots__ = ("allow_comments", "dir")
+
     def __init__(self, *args, allow_comments=False, directory=None, **kwargs):
         """
         Constructor. Also see Entry.__init__.
@@ -230,8 +555,24 @@ class Page(Entry):
         self.allow_comments = allow_comments
         self.dir = directory
 
+    @property
+    def fingerprint(self):
+        entry_fingerprint = super().fingerprint
+        if entry_fingerprint is None:
+            return None
+        return "%s:%s" % (entry_fingerprint, self.dir)
+
 
 class Post(Entry):
+    __slots__ = (
+        "_excerpt",
+        "_excerpt_markdown",
+        "pubdate",
+        "tags",
+        "allow_comments",
+        "_tag_links",
+    )
+
     def __init__(
         self,
         *args,
@@ -239,6 +580,7 @@ class Post(Entry):
         excerpt=None,
         tags=None,
         allow_comments=True,
+        excerpt_markdown=None,
         **kwargs,
     ):
         """
@@ -246,15 +588,55 @@ class Post(Entry):
 
         Args:
           pubdate (datetime): When the post was published.
-          excerpt (str): An excerpt of the post body.
+          excerpt (str): An excerpt of the post body, as HTML.
           tags (list): A list of Tag objects associated with the post.
           allow_comments (bool): Whether to allow comments. Default False.
+          excerpt_markdown (str): Optional markdown excerpt, rendered the first
+            time the excerpt is needed. Defaults to the first paragraph of the
+            markdown body.
         """
         super().__init__(*args, **kwargs)
-        self.excerpt = excerpt or _get_excerpt(self.body)
+        self._excerpt = excerpt or None
+        self._excerpt_markdown = excerpt_markdown
+        if self._excerpt is None and self.excerpt_markdown is None:
+            self._excerpt = _get_excerpt(self._body or "")
         self.pubdate = pubdate
         self.tags = tags or []
         self.allow_comments = allow_comments
+        self._tag_links = None
+
+    @property
+    def excerpt_markdown(self):
+        # derived from the body rather than stored, to save memory
+        if self._excerpt_markdown is None and self.markdown is not None:
+            return _get_excerpt(self.markdown)
+        return self._excerpt_markdown
+
+    @property
+    def excerpt(self):
+        """
+        The HTML excerpt of the post, rendered from markdown on first access.
+        """
+        if self._excerpt is None:
+            excerpt_markdown = self.excerpt_markdown
+            if excerpt_markdown is not None:
+                self._excerpt = self.render_markdown(excerpt_markdown)
+        return self._excerpt
+
+    @excerpt.setter
+    def excerpt(self, excerpt):
+        self._excerpt = excerpt
+
+    def get_unrendered(self):
+        unrendered = super().get_unrendered()
+        if self._excerpt is None and self.excerpt_markdown is not None:
+            unrendered.append(("excerpt", self.excerpt_markdown))
+        return unrendered
+
+    def evict(self):
+        super().evict()
+        if self.excerpt_markdown is not None:
+            self._excerpt = None
 
     @classmethod
     def make_tag(cls, tag_name):
@@ -281,7 +663,7 @@ class Post(Entry):
         if line.startswith("pubdate:"):
             pubdate_str = line[8:].strip()
             try:
-                kwargs["pubdate"] = dateutil.parser.parse(pubdate_str)
+                kwargs["pubdate"] = _parse_pubdate(pubdate_str)
             except ValueError:
                 LOG.warning("invalid pubdate given", exc_info=True)
             if "pubdate" in kwargs and not kwargs["pubdate"].tzinfo:
@@ -294,18 +676,39 @@ class Post(Entry):
 
         elif line.startswith("tags:"):
             line_tags = line[5:].strip().split(",")
-            kwargs["tags"] = [cls.make_tag(tag) for tag in line_tags if tag]
+            tags = [cls.make_tag(tag) for tag in line_tags if tag]
+            # the same tag given twice, maybe in different case, is listed once
+            kwargs["tags"] = list({id(tag): tag for tag in tags}.values())
 
-    @property
-    def url(self):
+    def _get_url(self):
         return "%s/posts/%s" % (self.root_url, self.slug)
 
+    @property
+    def fingerprint(self):
+        entry_fingerprint = super().fingerprint
+        if entry_fingerprint is None:
+            return None
+        pubdate = self.pubdate.isoformat() if self.pubdate else None
+        return "%s:%s" % (entry_fingerprint, pubdate)
+
     @property
     def tag_links(self):
         """
         Get a list of HTML links for all the tags associated with the post.
+        The links are memoized until the root_url changes or the post's tags
+        are replaced, and a new list is returned every time.
         """
-        return ['<a href="%s">%s</a>' % (tag.url, tag.title) for tag in self.tags]
+        root_url = self.root_url
+        memo = self._tag_links
+        if (
+            memo is None
+            or memo[0] != root_url
+            or memo[1] is not self.tags
+            or memo[2] != len(self.tags)
+        ):
+            links = ['<a href="%s">%s</a>' % (tag.url, tag.title) for tag in self.tags]
+            memo = self._tag_links = (root_url, self.tags, len(self.tags), links)
+        return list(memo[3])
 
     def __lt__(self, other):
         """
@@ -317,6 +720,8 @@ class Post(Entry):
 
 
 class Tag(Content):
+    __slots__ = ("title", "slug")
+
     def __init__(self, title, slug=None):
         if not title:
             raise ValueError("cannot create Tag with empty title")
@@ -327,17 +732,36 @@ class Tag(Content):
     def url(self):
         return self.root_url + "/tags/" + self.slug
 
+    @property
+    def fingerprint(self):
+        return "%s:%s" % (self.slug, self.title)
+
     def __lt__(self, other):
         return self.title < other.title
 
     def __eq__(self, other):
+        """
+        Tags are equal to tags with the same slug, and to strings matching
+        their slug or (case-insensitively) their title.
+        """
         if isinstance(other, Tag):
             return self.slug == other.slug
         if not isinstance(other, str):
-            raise ValueError("can only compare with Tag or str, %s given" % type(other))
+            return NotImplemented
+        # most comparisons are with slugs, so avoid lowercasing if we can
+        if self.slug == other:
+            return True
         other = other.lower()
         return self.slug == other or self.title.lower() == other
 
+    def __hash__(self):
+        """
+        Tags hash by slug, so that sets and dicts of tags hold one tag per
+        slug. Don't mix tags and strings as keys: a tag is equal to its title,
+        but doesn't hash like it.
+        """
+        return hash(self.slug)
+
 
 class CaseInsensitiveDict(dict):
     """
@@ -354,6 +778,64 @@ class CaseInsensitiveDict(dict):
         return super().__contains__(key.lower())
 
 
+class PostIndex:
+    """
+    Precomputed lookups over a list of posts, so that queries for posts with
+    or without certain tags, or from a certain year or month, don't have to
+    go through every post. Lists keep the order of the posts they were built
+    from.
+    """
+
+    def __init__(self, posts):
+        self.all = list(posts)
+        self.public = [post for post in self.all if post.public]
+        self.by_tag = {}
+        self.public_by_tag = {}
+        self.by_year = {}
+        self.by_month = {}
+        self.tag_slugs = {}
+        self.title_slugs = {}
+        self._excluding = {}
+
+        for post in self.all:
+            for tag in post.tags:
+                self.title_slugs[tag.title.lower()] = tag.slug
+            slugs = frozenset(tag.slug for tag in post.tags)
+            self.tag_slugs[id(post)] = slugs
+            for slug in slugs:
+                self.by_tag.setdefault(slug, []).append(post)
+                if post.public:
+                    self.public_by_tag.setdefault(slug, []).append(post)
+            if post.public and post.pubdate:
+                year, month = post.pubdate.year, post.pubdate.month
+                self.by_year.setdefault(year, []).append(post)
+                self.by_month.setdefault((year, month), []).append(post)
+
+    @functools.cached_property
+    def fingerprint(self):
+        """
+        A digest of the fingerprints of every post, or None if any of them
+        can't be fingerprinted. Computed once per index.
+        """
+        parts = [post.fingerprint for post in self.all]
+        if None in parts:
+            return None
+        return digest(*parts)
+
+    def excluding(self, slugs, private=False):
+        """
+        Get posts that have none of the given tag slugs. Results are cached
+        for each combination of slugs.
+        """
+        key = (frozenset(slugs), private)
+        if key not in self._excluding:
+            posts = self.all if private else self.public
+            self._excluding[key] = [
+                post for post in posts if self.tag_slugs[id(post)].isdisjoint(key[0])
+            ]
+        return self._excluding[key]
+
+
 class ContentManager:
     """
     Class that keeps track of various content.
@@ -364,36 +846,176 @@ class ContentManager:
     is. Also keeps track of tags to avoid duplicate instances of Tag objectss
     """
 
-    def __init__(self, root_url):
+    def __init__(self, root_url, cache=None, profiler=None):
         # pylint: disable=invalid-name
-        self.Page = type("CM_Page", (Page,), {"cm": self})
-        self.Post = type("CM_Post", (Post,), {"cm": self})
-        self.Tag = type("CM_Tag", (Tag,), {"cm": self})
+        self.Page = type("CM_Page", (Page,), {"__slots__": (), "cm": self})
+        self.Post = type("CM_Post", (Post,), {"__slots__": (), "cm": self})
+        self.Tag = type("CM_Tag", (Tag,), {"__slots__": (), "cm": self})
         # pylint: enable=invalid-name
         self.root_url = root_url
         self.pages = []
         self.posts = []
         self.tags = []
+        self.tags_by_slug = {}
         self.tags_dict = CaseInsensitiveDict()
+        self.cache = cache
+        self.profiler = profiler or BuildProfiler()
+        self._index = None
+
+    @property
+    def index(self):
+        """
+        A PostIndex of the posts. Rebuilt when posts (or pages, so that a new
+        index means the content changed) are added or removed through the
+        content manager - if you modify the list of posts directly, call
+        invalidate_index afterwards.
+        """
+        if self._index is None:
+            self._index = PostIndex(self.posts)
+        return self._index
+
+    def invalidate_index(self):
+        self._index = None
+
+    def _get_tag_slug(self, tag):
+        """
+        Get the slug of a tag, given either a Tag or a string matching a tag's
+        slug or title (case-insensitive), just like Tag.__eq__.
+        """
+        if isinstance(tag, Tag):
+            return tag.slug
+        if tag in self.index.by_tag:
+            return tag
+        tag = tag.lower()
+        return self.index.title_slugs.get(tag, tag)
+
+    def get_posts(self, num=None, tag=None, exclude_tags=None, private=False):
+        """
+        Get posts, in sorted order. See BlogEngine.get_posts.
+        """
+        index = self.index
+        if tag:
+            by_tag = index.by_tag if private else index.public_by_tag
+            posts = by_tag.get(self._get_tag_slug(tag), [])
+        elif exclude_tags:
+            slugs = {self._get_tag_slug(tag) for tag in exclude_tags}
+            posts = index.excluding(slugs, private=private)
+        else:
+            posts = index.all if private else index.public
+
+        # always return a copy, so that the index can't be modified
+        return posts[:num] if num else posts[:]
+
+    def render_markdown(self, text):
+        """
+        Render markdown to HTML. If the content manager has a build cache, the
+        result is looked up in and stored to it.
+        """
+        if self.cache is None:
+            with self.profiler.timer("markdown"):
+                return render_markdown(text)
+        key = get_markdown_cache_key(text)
+        html = self.cache.get("markdown", key)
+        if html is None:
+            with self.profiler.timer("markdown"):
+                html = render_markdown(text)
+            self.cache.set("markdown", key, html)
+        return html
+
+    def render_markdown_many(self, texts, workers=None):
+        """
+        Render many markdown strings to HTML in parallel. Only markdown that
+        isn't already in the build cache is actually rendered.
+        """
+        if self.cache is None:
+            with self.profiler.timer("markdown"):
+                return render_markdown_many(texts, workers=workers)
+        keys = [get_markdown_cache_key(text) for text in texts]
+        htmls = [self.cache.get("markdown", key) for key in keys]
+        missing = [idx for idx, html in enumerate(htmls) if html is None]
+        with self.profiler.timer("markdown"):
+            rendered = render_markdown_many([texts[idx] for idx in missing], workers)
+        for idx, html in zip(missing, rendered):
+            htmls[idx] = html
+            self.cache.set("markdown", keys[idx], html)
+        return htmls
+
+    def render_entries(self, entries, workers=None):
+        """
+        Render the markdown of entries that hasn't been rendered yet, in
+        parallel. Entries otherwise render their markdown when it is first
+        used, which is fine unless that happens in a worker process, where the
+        result would be thrown away.
+        """
+        _render_entries(entries, self.render_markdown_many, workers=workers)
+
+    def keep_cached_markdown(self, entries):
+        """
+        Keep the cached HTML of entries whose markdown wasn't needed during
+        this build, for example because the pages showing them were
+        unchanged, so that it isn't dropped from the build cache.
+        """
+        if self.cache is None:
+            return
+        for entry in entries:
+            for _, text in entry.get_unrendered():
+                self.cache.keep("markdown", get_markdown_cache_key(text))
 
     def make_tag(self, tag_name):
+        """
+        Get the Tag object for a tag name, creating it if needed. Names which
+        only differ by case give the same Tag object. Names which differ in
+        other ways but have the same slug, like "C++" and "C#", give different
+        Tag objects, so that each keeps its title, but only the first one added
+        is registered in tags and tags_by_slug.
+        """
         tag_name = tag_name.strip()
         if tag_name not in self.tags_dict:
             self.tags_dict[tag_name] = self.Tag(tag_name)
         return self.tags_dict[tag_name]
 
+    def get_tag(self, tag):
+        """
+        Look up a tag of a post that has been added, by slug or by title
+        (case-insensitive). Returns None if there is no such tag.
+        """
+        found = self.tags_by_slug.get(tag)
+        if found is None and tag in self.tags_dict:
+            found = self.tags_by_slug.get(self.tags_dict[tag].slug)
+        return found
+
     def add_pages(self, pages, resort=True):
         self.pages.extend(pages)
         if resort:
             self.pages.sort()
+        self.invalidate_index()
 
     def add_posts(self, posts, resort=True):
         self.posts.extend(posts)
         for post in posts:
             for tag in post.tags:
-                if tag not in self.tags:
+                if tag.slug not in self.tags_by_slug:
+                    self.tags_by_slug[tag.slug] = tag
                     self.tags.append(tag)
 
         if resort:
             self.tags.sort()
             self.posts.sort()
+        self.invalidate_index()
+
+    def remove_pages(self, pages):
+        remove_ids = {id(page) for page in pages}
+        self.pages[:] = [page for page in self.pages if id(page) not in remove_ids]
+        self.invalidate_index()
+
+    def remove_posts(self, posts):
+        """
+        Remove posts, as well as any tags that no longer have any posts.
+        """
+        remove_ids = {id(post) for post in posts}
+        self.posts[:] = [post for post in self.posts if id(post) not in remove_ids]
+        used_slugs = {tag.slug for post in self.posts for tag in post.tags}
+        self.tags[:] = [tag for tag in self.tags if tag.slug in used_slugs]
+        for slug in set(self.tags_by_slug) - used_slugs:
+            del self.tags_by_slug[slug]
+        self.invalidate_index()
@@ -0,0 +1,68 @@
+import collections
+
+
+class DependencyGraph:
+    """
+    Keeps track of which inputs each output was generated from, so that we
+    can tell which outputs are affected when some inputs change.
+
+    Inputs are usually full paths of source files, templates or content
+    directories (a directory stands for the set of files in it, so list pages
+    depend on it to be regenerated when files are added or removed). Outputs
+    are paths relative to the destination directory.
+
+    Inputs can also depend on other inputs, for example a template that
+    extends another one - if the base template changes, every output using
+    the extending template is affected as well.
+    """
+
+    def __init__(self):
+        self._output_inputs = {}
+        self._input_outputs = collections.defaultdict(set)
+        self._input_dependents = collections.defaultdict(set)
+
+    def set_inputs(self, output, inputs):
+        """
+        Set the inputs an output is generated from, replacing the inputs
+        previously set for it.
+        """
+        inputs = frozenset(inputs)
+        for old_input in self._output_inputs.get(output, ()):
+            self._input_outputs[old_input].discard(output)
+        self._output_inputs[output] = inputs
+        for new_input in inputs:
+            self._input_outputs[new_input].add(output)
+
+    def add_dependency(self, dependent, dependency):
+        """
+        Record that an input depends on another input.
+        """
+        self._input_dependents[dependency].add(dependent)
+
+    def get_inputs(self, output):
+        return self._output_inputs.get(output, frozenset())
+
+    @property
+    def outputs(self):
+        return set(self._output_inputs)
+
+    def dirty(self, changed_inputs):
+        """
+        Get the outputs affected by some inputs changing.
+
+        Args:
+          changed_inputs (iterable): The inputs that changed.
+
+        Returns a set of outputs.
+        """
+        seen = set()
+        queue = list(changed_inputs)
+        dirty = set()
+        while queue:
+            node = queue.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            dirty.update(self._input_outputs.get(node, ()))
+            queue.extend(self._input_dependents.get(node, ()))
+        return dirty
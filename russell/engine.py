@@ -1,17 +1,134 @@
 from datetime import datetime
-import hashlib
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import gzip
+import inspect
+import itertools
+import json
 import logging
+import math
+import multiprocessing
 import os
 import os.path
-import shutil
+import re
+import time
 
 import jinja2
+import jinja2.defaults
+import jinja2.meta
 
+import russell.cache
 import russell.content
+import russell.depgraph
 import russell.feed
+import russell.output
+import russell.profiling
 import russell.sitemap
 
 LOG = logging.getLogger(__name__)
+profiled = russell.profiling.profiled
+
+# an input of the dependency graph which stands for the global variables given
+# to every template, like the list of tags and asset hashes.
+GLOBALS_INPUT = "<globals>"
+
+# a page that needs to be rendered. render_key is used by the build cache.
+PendingPage = collections.namedtuple(
+    "PendingPage", ("path", "cache_key", "render_key", "template", "kwargs")
+)
+
+# the pages being rendered by a pool of workers. set in the parent process
+# before the workers are started, so that forked workers inherit it instead of
+# having to pickle templates and content.
+_pending_pages = []
+
+
+def _render_pending_pages(indexes):
+    results = []
+    for idx in indexes:
+        page = _pending_pages[idx]
+        start = time.perf_counter()
+        try:
+            html, error = page.template.render(**page.kwargs), None
+        except Exception as exc:  # pylint: disable=broad-except
+            html, error = None, "%s: %s" % (type(exc).__name__, exc)
+        results.append((html, error, time.perf_counter() - start))
+    return results
+
+
+class Pagination:
+    """
+    Passed to templates of paginated lists of posts as `pagination`.
+    """
+
+    def __init__(self, page, num_pages, get_url):
+        """
+        Constructor.
+
+        Args:
+          page (int): The current page number, starting at 1.
+          num_pages (int): The total number of pages.
+          get_url (callable): Function which returns the URL of a page number.
+        """
+        self.page = page
+        self.num_pages = num_pages
+        self.get_url = get_url
+
+    @property
+    def prev_url(self):
+        if self.page > 1:
+            return self.get_url(self.page - 1)
+        return None
+
+    @property
+    def next_url(self):
+        if self.page < self.num_pages:
+            return self.get_url(self.page + 1)
+        return None
+
+    @property
+    def fingerprint(self):
+        return "%d/%d:%s" % (self.page, self.num_pages, self.get_url(1))
+
+
+class TemplateError(Exception):
+    """
+    Raised when one or more templates failed to compile.
+    """
+
+    def __init__(self, errors):
+        """
+        Constructor.
+
+        Args:
+          errors (dict): Error messages, keyed by the name of the template.
+        """
+        self.errors = errors
+        super().__init__(
+            "%d template(s) failed to compile:\n%s"
+            % (len(errors), "\n".join("%s: %s" % item for item in errors.items()))
+        )
+
+
+class RenderError(Exception):
+    """
+    Raised when one or more pages failed to render.
+    """
+
+    def __init__(self, errors):
+        """
+        Constructor.
+
+        Args:
+          errors (dict): Error messages, keyed by the path of the page.
+        """
+        self.errors = errors
+        super().__init__(
+            "%d page(s) failed to render:\n%s"
+            % (len(errors), "\n".join("%s: %s" % item for item in errors.items()))
+        )
 
 
 def _listfiles(root_dir):
@@ -24,6 +141,36 @@ def _listfiles(root_dir):
     return results
 
 
+def _is_in_dir(path, directory):
+    return path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+def _get_listing_keys(posts):
+    """
+    Get the attributes of posts which decide which lists of posts (index,
+    archives, tags...) they show up in.
+    """
+    return [
+        (post.title, post.pubdate, post.public, [tag.slug for tag in post.tags])
+        for post in posts
+    ]
+
+
+def _get_entries(pending):
+    """
+    Get the distinct entries passed to the templates of some pending pages,
+    either directly or in lists.
+    """
+    entries = {}
+    for page in pending:
+        for value in page.kwargs.values():
+            values = value if isinstance(value, (list, tuple)) else (value,)
+            for item in values:
+                if isinstance(item, russell.content.Entry):
+                    entries[id(item)] = item
+    return list(entries.values())
+
+
 def make_link(title, url, blank=False):
     """
     Make a HTML link out of an URL.
@@ -53,6 +200,13 @@ class BlogEngine:
         site_title,
         site_desc=None,
         cache_busting_strategy="qs",
+        cache_dir=None,
+        full_build=False,
+        render_workers=None,
+        evict_bodies=False,
+        profile=None,
+        cprofile=None,
+        template_cache=False,
     ):
         """
         Constructor.
@@ -64,21 +218,79 @@ class BlogEngine:
           site_title (str): The title of your website.
           site_desc (str): A subtitle or description of your website.
           cache_busting_strategy (str): None, "qs" or "part"
+          cache_dir (str): Optional directory, relative to root_path, in which
+            to keep a build cache between runs. Makes it possible to skip
+            markdown conversion and page rendering for unchanged content. If
+            not provided, the cache only lives for as long as the engine.
+          full_build (bool): If True, ignore the existing build cache and
+            regenerate everything.
+          render_workers (int): If more than 1, pages generated in bulk (posts,
+            pages, tags) are rendered across this many worker processes, or
+            threads where forking isn't safe.
+          evict_bodies (bool): If True, forget the rendered HTML of posts and
+            pages once a page using them has been written, to keep memory use
+            down on large sites. It is read back from the build cache if it is
+            needed again, so this works best with a cache_dir.
+          profile (bool or str): If set, time the phases of the build and the
+            rendering of each output. When the build finishes, a summary is
+            logged, or if this is a path, the timings are saved to it as JSON.
+          cprofile (str): Optional path to save a cProfile of the build to.
+          template_cache (bool): If True, keep compiled templates in the
+            cache_dir between runs, so that unchanged templates don't have to
+            be compiled again. Has no effect without a cache_dir.
         """
         assert os.path.exists(root_path), "root_path must be an existing directory"
         self.root_path = root_path
         self.root_url = root_url or ""
         self.site_title = site_title
         self.site_desc = site_desc
+        self.render_workers = render_workers or 1
+        self.evict_bodies = evict_bodies
+        self.profile = profile
+        self.cprofile = cprofile
+        self.profiler = russell.profiling.BuildProfiler(
+            enabled=bool(profile), cprofile=bool(cprofile)
+        )
+
+        cache_path = manifest_path = bytecode_cache = None
+        if cache_dir:
+            cache_path = os.path.join(root_path, cache_dir, "build.json")
+            manifest_path = os.path.join(root_path, cache_dir, "manifest.json")
+            if template_cache:
+                jinja_cache_dir = os.path.join(root_path, cache_dir, "jinja")
+                os.makedirs(jinja_cache_dir, exist_ok=True)
+                # compiled templates are checked against a checksum of their
+                # source, so edited templates are recompiled
+                bytecode_cache = jinja2.FileSystemBytecodeCache(jinja_cache_dir)
+        # rendered markdown is kept in a file per entry, so that it doesn't
+        # all have to be loaded into memory with the rest of the cache
+        self.cache = russell.cache.BuildCache(
+            cache_path, full=full_build, file_sections=("markdown",)
+        )
+        self.output = russell.output.OutputWriter(
+            self._get_dist_path([]), manifest_path, full=full_build
+        )
+        self._templates = {}
+        self._template_digests = {}
+        self._fragments = {}
+        self._globals_fingerprint = None
+        self._source_digests = {}
+        # outputs that reload() found to be unaffected by the changes
+        self._clean_outputs = set()
+        self.deps = russell.depgraph.DependencyGraph()
+        self._content_dirs = {}
+        self._asset_dirs = set()
 
         self.cm = russell.content.ContentManager(
-            root_url
+            root_url, cache=self.cache, profiler=self.profiler
         )  # pylint: disable=invalid-name
         self.pages = self.cm.pages
         self.posts = self.cm.posts
         self.tags = self.cm.tags
 
         self.asset_hash = {}
+        self._fingerprinted_paths = {}
+        self.cache_busting_strategy = cache_busting_strategy
         if cache_busting_strategy == "qs":
             self.get_asset_url = self.get_asset_url_qs
         elif cache_busting_strategy == "part":
@@ -89,12 +301,15 @@ class BlogEngine:
 
         self.jinja = jinja2.Environment(
             loader=jinja2.FileSystemLoader(os.path.join(root_path, "templates")),
+            bytecode_cache=bytecode_cache,
         )
         self.jinja.globals.update(
             {
                 "a": make_link,
                 "asset_hash": self.asset_hash,
                 "asset_url": self.get_asset_url,
+                "cached_fragment": self.cached_fragment,
+                "get_tag": self.cm.get_tag,
                 "now": datetime.now(),
                 "root_url": self.root_url,
                 "site_description": self.site_desc,
@@ -102,6 +317,8 @@ class BlogEngine:
                 "tags": self.tags,
             }
         )
+        # globals added later, for example in config.py, may read content
+        self._builtin_globals = dict(self.jinja.globals)
 
     def get_asset_url_qs(self, path):
         """
@@ -120,88 +337,377 @@ class BlogEngine:
     def get_asset_url_part(self, path):
         """
         Get the URL of an asset. If asset hashes are added and one exists for
-        the path, it will be appended as a query string.
+        the path, it will be inserted into the filename, for example
+        "style.css" becomes "style.<hash>.css".
 
         Args:
           path (str): Path to the file, relative to your "assets" directory.
         """
         if path.endswith(self.bust_extensions) and path in self.asset_hash:
+            path = self.get_fingerprinted_path(path)
+        return self.root_url + "/assets/" + path
+
+    def get_fingerprinted_path(self, path):
+        """
+        Get the path of an asset with its hash inserted into the filename.
+
+        Args:
+          path (str): Path to the file, relative to your "assets" directory.
+            Must have had its hash added.
+        """
+        key = (path, self.asset_hash[path])
+        if key not in self._fingerprinted_paths:
             *dirs, filename = path.split("/")
             file_parts = filename.split(".", maxsplit=1)
             file_parts.insert(1, self.asset_hash[path])
-            path = "/".join(dirs + [".".join(file_parts)])
-        return self.root_url + "/assets/" + path
+            self._fingerprinted_paths[key] = "/".join(dirs + [".".join(file_parts)])
+        return self._fingerprinted_paths[key]
+
+    _fingerprint_pattern = re.compile(r"^[0-9a-f]{16,64}$")
 
-    def add_pages(self, path="pages"):
+    def _is_fingerprinted_path(self, relpath, relpaths):
+        """
+        Check if a path is a fingerprinted copy of another asset, which has
+        been generated by write_fingerprinted_assets.
+        """
+        directory, filename = os.path.split(relpath)
+        file_parts = filename.split(".", maxsplit=2)
+        return (
+            len(file_parts) == 3
+            and self._fingerprint_pattern.match(file_parts[1]) is not None
+            and os.path.join(directory, file_parts[0] + "." + file_parts[2]) in relpaths
+        )
+
+    @profiled
+    def add_pages(self, path="pages", parallel=False, workers=None):
         """
         Look through a directory for markdown files and add them as pages.
+
+        Args:
+          path (str): The directory to look in, relative to root_path.
+          parallel (bool): If True, render the markdown of the pages across a
+            pool of processes.
+          workers (int): How many processes to use if parallel is True.
+            Defaults to the number of CPUs.
         """
         pages_path = os.path.join(self.root_path, path)
-        pages = []
-        for file in _listfiles(pages_path):
-            page_dir = os.path.relpath(os.path.dirname(file), pages_path)
-            if page_dir == ".":
-                page_dir = None
-            pages.append(self.cm.Page.from_file(file, directory=page_dir))
-        self.cm.add_pages(pages)
+        if pages_path in self._content_dirs:
+            # in watch mode, generate() may run again. reload() has already
+            # brought the pages up to date, so don't add them twice
+            LOG.debug("pages in %r have already been added", pages_path)
+            return
+        self._content_dirs[pages_path] = "pages"
+        files = [
+            (file, self._get_page_kwargs(pages_path, file))
+            for file in _listfiles(pages_path)
+        ]
+        self.cm.add_pages(self._load_entries(self.cm.Page, files, parallel, workers))
 
-    def add_posts(self, path="posts"):
+    @staticmethod
+    def _get_page_kwargs(pages_path, file):
+        page_dir = os.path.relpath(os.path.dirname(file), pages_path)
+        if page_dir == ".":
+            page_dir = None
+        return {"directory": page_dir}
+
+    @profiled
+    def add_posts(self, path="posts", parallel=False, workers=None):
         """
         Look through a directory for markdown files and add them as posts.
+
+        Args:
+          path (str): The directory to look in, relative to root_path.
+          parallel (bool): If True, render the markdown of the posts across a
+            pool of processes.
+          workers (int): How many processes to use if parallel is True.
+            Defaults to the number of CPUs.
+        """
+        path = os.path.join(self.root_path, path)
+        if path in self._content_dirs:
+            LOG.debug("posts in %r have already been added", path)
+            return
+        self._content_dirs[path] = "posts"
+        files = [(file, {}) for file in _listfiles(path)]
+        self.cm.add_posts(self._load_entries(self.cm.Post, files, parallel, workers))
+
+    @profiled
+    def scan_posts(self, path="posts"):
+        """
+        Read the metadata of every post in a directory, without reading the
+        body of any post or adding them to the blog. Useful to quickly find
+        out which posts exist, which are public, what tags they have and so
+        on, even for very large sites.
+
+        Args:
+          path (str): The directory to look in, relative to root_path.
+
+        Returns a list of russell.content.EntryHeader, sorted by path.
         """
         path = os.path.join(self.root_path, path)
-        self.cm.add_posts([self.cm.Post.from_file(file) for file in _listfiles(path)])
+        return [
+            russell.content.Post.scan_file(file) for file in sorted(_listfiles(path))
+        ]
+
+    @profiled
+    def scan_pages(self, path="pages"):
+        """
+        Read the metadata of every page in a directory. See scan_posts.
+        """
+        path = os.path.join(self.root_path, path)
+        return [
+            russell.content.Page.scan_file(file) for file in sorted(_listfiles(path))
+        ]
+
+    def _load_entries(self, cls, files, parallel=False, workers=None):
+        if parallel:
+            return cls.from_files(files, workers=workers)
+        return [cls.from_file(file, **kwargs) for file, kwargs in files]
+
+    @property
+    def source_dirs(self):
+        """
+        The directories that content, templates and assets have been read
+        from. Changes to files in these directories may require the blog to be
+        regenerated.
+        """
+        dirs = list(self._content_dirs)
+        dirs.extend(getattr(self.jinja.loader, "searchpath", []))
+        dirs.extend(self._asset_dirs)
+        return dirs
+
+    @profiled
+    def reload(self, paths):
+        """
+        Bring the blog up to date after files have been created, modified or
+        deleted on disk, so that generating the blog again only re-renders the
+        pages that are affected. Posts and pages are re-read, and templates
+        will be re-read the next time they are used.
+
+        Args:
+          paths (iterable): Full paths of the files that changed.
+
+        Returns the set of outputs affected by the changes, according to the
+        dependency graph of the previous build.
+        """
+        self._templates.clear()
+        self._template_digests.clear()
+        self._fragments.clear()
+        self._globals_fingerprint = None
+        self._source_digests.clear()
+        self.output.reset()
+
+        changed = set(paths)
+        old_tags = [tag.fingerprint for tag in self.tags]
+        for path in paths:
+            if any(_is_in_dir(path, asset_dir) for asset_dir in self._asset_dirs):
+                # assets may change the asset hashes given to every template
+                changed.add(GLOBALS_INPUT)
+                continue
+
+            for content_dir, content_type in self._content_dirs.items():
+                if _is_in_dir(path, content_dir):
+                    break
+            else:
+                continue
 
-    def copy_assets(self, path="assets"):
+            if content_type == "posts":
+                old_posts = [post for post in self.posts if post.source_path == path]
+                self.cm.remove_posts(old_posts)
+                new_posts = []
+                if os.path.exists(path):
+                    LOG.info("reloading post %r", path)
+                    new_posts = [self.cm.Post.from_file(path)]
+                    self.cm.add_posts(new_posts)
+                # if a post was added, removed or changed in a way that might
+                # change which lists it's in, every list of posts is affected
+                if _get_listing_keys(old_posts) != _get_listing_keys(new_posts):
+                    changed.add(content_dir)
+            else:
+                old_pages = [page for page in self.pages if page.source_path == path]
+                self.cm.remove_pages(old_pages)
+                if os.path.exists(path):
+                    LOG.info("reloading page %r", path)
+                    kwargs = self._get_page_kwargs(content_dir, path)
+                    self.cm.add_pages([self.cm.Page.from_file(path, **kwargs)])
+                if not old_pages or not os.path.exists(path):
+                    changed.add(content_dir)
+
+        if old_tags != [tag.fingerprint for tag in self.tags]:
+            changed.add(GLOBALS_INPUT)
+
+        dirty = self.deps.dirty(changed)
+        self._clean_outputs = self.deps.outputs - dirty
+        return dirty
+
+    def _is_clean(self, relpath):
+        """
+        Check if an output is known to be unaffected by the changes passed to
+        reload, in which case it is recorded as unchanged, and doesn't need to
+        be prepared or generated again.
         """
-        Copy assets into the destination directory.
+        if relpath not in self._clean_outputs:
+            return False
+        path = self._get_dist_path(relpath)
+        if not os.path.exists(path):
+            return False
+        self.output.skip(path)
+        return True
+
+    @profiled
+    def copy_assets(self, path="assets", link=None, workers=None):
+        """
+        Copy assets into the destination directory. Files that are already
+        in place with the same size and modification time (or contents) are
+        not copied again.
+
+        Args:
+          path (str): The directory to copy from, relative to root_path.
+          link (str): None to copy files, "hard" to hard link them instead, or
+            "reflink" to make copy-on-write clones on filesystems that support
+            it.
+          workers (int): How many threads to copy files with. Defaults to what
+            concurrent.futures.ThreadPoolExecutor thinks is reasonable.
         """
         path = os.path.join(self.root_path, path)
+        self._asset_dirs.add(path)
+        copies = []
         for root, _, files in os.walk(path):
             for file in files:
                 fullpath = os.path.join(root, file)
                 relpath = os.path.relpath(fullpath, path)
-                copy_to = os.path.join(self._get_dist_path(relpath, directory="assets"))
-                LOG.debug("copying %r to %r", fullpath, copy_to)
-                shutil.copyfile(fullpath, copy_to)
+                copy_to = self._get_dist_path(relpath, directory="assets")
+                copies.append((fullpath, copy_to))
+                self.deps.set_inputs(os.path.join("assets", relpath), [fullpath])
 
-    def add_asset_hashes(self, path="dist/assets"):
+        def copy_asset(copy):
+            return self.output.copy(*copy, link=link)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(copy_asset, copies))
+
+    # algorithms that can be used for asset hashes, and the digest size to use
+    # for them. blake2b is faster than md5, and 8 bytes is plenty for
+    # telling versions of a file apart.
+    asset_hash_algorithms = {
+        "md5": None,
+        "sha1": None,
+        "blake2b": 8,
+    }
+
+    @profiled
+    def add_asset_hashes(self, path="dist/assets", algorithm="md5", workers=None):
         """
         Scan through a directory and add hashes for each file found.
-        """
-        for fullpath in _listfiles(os.path.join(self.root_path, path)):
-            relpath = fullpath.replace(self.root_path + "/" + path + "/", "")
-            md5sum = hashlib.md5(open(fullpath, "rb").read()).hexdigest()
-            LOG.debug("MD5 of %s (%s): %s", fullpath, relpath, md5sum)
-            self.asset_hash[relpath] = md5sum
 
-    def get_posts(self, num=None, tag=None, exclude_tags=None, private=False):
+        Hashes are stored in the build cache along with the size and mtime of
+        the file, so files that haven't changed aren't hashed again.
+
+        Args:
+          path (str): The directory to scan, relative to root_path.
+          algorithm (str): The hash algorithm to use, one of the keys of
+            asset_hash_algorithms.
+          workers (int): How many threads to hash files with. Defaults to
+            what concurrent.futures.ThreadPoolExecutor thinks is reasonable.
         """
-              Get all the posts added to the blog.
+        digest_size = self.asset_hash_algorithms[algorithm]
+        asset_dir = os.path.join(self.root_path, path)
+
+        relpaths = {
+            os.path.relpath(fullpath, asset_dir): fullpath
+            for fullpath in _listfiles(asset_dir)
+        }
+        # forget the hashes of files which have since been deleted. the dict
+        # is a template global, so it is updated in place
+        hashed = {
+            relpath
+            for relpath in relpaths
+            if not self._is_fingerprinted_path(relpath, relpaths)
+        }
+        for relpath in set(self.asset_hash) - hashed:
+            del self.asset_hash[relpath]
 
-              Args:
-                num (int): Optional. If provided, only return N posts (sorted by date,
-                  most recent first).
-                tag (Tag): Optional. If provided, only return posts that have a
-                  specific tag.
-        exclude_tags (set): Optional. If provided, don't return posts that
-          have these tags.
-                private (bool): By default (if False), private posts are not included.
-                  If set to True, private posts will also be included.
+        to_hash = []
+        for relpath in sorted(hashed):
+            fullpath = relpaths[relpath]
+            stat = os.stat(fullpath)
+            cache_key = "%s:%s" % (algorithm, os.path.relpath(fullpath, self.root_path))
+            cached = self.cache.get("asset_hashes", cache_key)
+            if cached and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+                self.asset_hash[relpath] = cached[2]
+            else:
+                to_hash.append((fullpath, relpath, cache_key, stat))
+
+        def hash_asset(fullpath):
+            return russell.cache.hash_file(fullpath, algorithm, digest_size)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            hashes = pool.map(hash_asset, [item[0] for item in to_hash])
+            for (fullpath, relpath, cache_key, stat), file_hash in zip(to_hash, hashes):
+                LOG.debug("%s of %s (%s): %s", algorithm, fullpath, relpath, file_hash)
+                self.asset_hash[relpath] = file_hash
+                self.cache.set(
+                    "asset_hashes",
+                    cache_key,
+                    [stat.st_size, stat.st_mtime_ns, file_hash],
+                )
+
+        # the hashes are template globals
+        self._globals_fingerprint = None
+        if self.cache_busting_strategy == "part":
+            self.write_fingerprinted_assets(path)
+
+    @profiled
+    def write_fingerprinted_assets(
+        self, path="dist/assets", manifest_path=None, link=None
+    ):
         """
-        posts = self.posts
+        Write a copy of each cache-busted asset with its hash in the filename,
+        which is where get_asset_url_part points. This lets any static web
+        server serve them, and cache them forever, without rewrite rules. This
+        is done automatically by add_asset_hashes when the "part" cache
+        busting strategy is used.
 
-        if not private:
-            posts = [post for post in posts if post.public]
+        Args:
+          path (str): The directory the assets are in, relative to root_path.
+          manifest_path (str): Optional path, relative to the destination
+            directory, of a JSON file mapping asset paths to their
+            fingerprinted paths, for use by other tools.
+          link (str): How to make the copies, see OutputWriter.copy.
+        """
+        asset_dir = os.path.join(self.root_path, path)
+        manifest = {}
+        for relpath in sorted(self.asset_hash):
+            if not relpath.endswith(self.bust_extensions):
+                continue
+            fingerprinted = self.get_fingerprinted_path(relpath)
+            manifest[relpath] = fingerprinted
+            self.output.copy(
+                os.path.join(asset_dir, relpath),
+                os.path.join(asset_dir, fingerprinted),
+                link=link,
+            )
+        if manifest_path:
+            self.write_file(manifest_path, json.dumps(manifest, indent=2))
 
-        if tag:
-            posts = [post for post in posts if tag in post.tags]
-        elif exclude_tags:
-            posts = [post for post in posts if not post.has_tags(exclude_tags)]
+    def get_posts(self, num=None, tag=None, exclude_tags=None, private=False):
+        """
+        Get all the posts added to the blog. Posts are looked up in an index
+        which is kept by the content manager, so this is cheap to call many
+        times.
 
-        if num:
-            return posts[:num]
-        return posts
+        Args:
+          num (int): Optional. If provided, only return N posts (sorted by date,
+            most recent first).
+          tag (Tag): Optional. If provided, only return posts that have a
+            specific tag.
+          exclude_tags (set): Optional. If provided, don't return posts that
+            have these tags.
+          private (bool): By default (if False), private posts are not included.
+            If set to True, private posts will also be included.
+        """
+        return self.cm.get_posts(
+            num=num, tag=tag, exclude_tags=exclude_tags, private=private
+        )
 
     def _get_dist_path(self, path, directory=None):
         if isinstance(path, str):
@@ -212,42 +718,305 @@ class BlogEngine:
             path.insert(0, directory)
         return os.path.join(self.root_path, "dist", *path)
 
+    @profiled
+    def precompile_templates(self, extensions=("jinja", "html", "xml")):
+        """
+        Compile every template up front, instead of when it is first used, so
+        that the first pages don't take longer to render and syntax errors in
+        any template are found before anything is generated.
+
+        Args:
+          extensions (iterable): Only compile templates with these file
+            extensions. None compiles every file in the templates directory.
+
+        Returns the names of the templates that were compiled. Raises a
+        TemplateError listing every template that failed to compile.
+        """
+        names = self.jinja.list_templates(extensions=extensions)
+        errors = {}
+        for name in names:
+            try:
+                self.jinja.get_template(name)
+            except jinja2.TemplateSyntaxError as exc:
+                errors[name] = "line %s: %s" % (exc.lineno, exc.message)
+        if errors:
+            raise TemplateError(errors)
+        LOG.debug("compiled %d templates", len(names))
+        return names
+
     def _get_template(self, template):
         if isinstance(template, str):
             template = self.jinja.get_template(template)
         return template
 
+    def _get_template_info(self, name):
+        """
+        Get a template's source, filename, and the names of the templates it
+        extends, includes or imports. A name of None means that a template is
+        referenced dynamically.
+        """
+        if name not in self._templates:
+            source, filename, _ = self.jinja.loader.get_source(self.jinja, name)
+            refs = jinja2.meta.find_referenced_templates(self.jinja.parse(source))
+            self._templates[name] = (source, filename, set(refs))
+            for ref_name in self._templates[name][2]:
+                if ref_name:
+                    ref_filename = self._get_template_info(ref_name)[1]
+                    self.deps.add_dependency(filename, ref_filename)
+        return self._templates[name]
+
+    def _get_template_digest(self, name):
+        """
+        Get a digest of a template's source, including the templates it extends
+        or includes. Returns None if the template's dependencies can't be
+        determined statically.
+        """
+        if name not in self._template_digests:
+            # prevent infinite recursion on templates that include themselves
+            self._template_digests[name] = None
+            source, _, refs = self._get_template_info(name)
+            parts = [source]
+            for ref_name in sorted(refs, key=str):
+                ref_digest = self._get_template_digest(ref_name) if ref_name else None
+                if ref_digest is None:
+                    return None
+                parts.append(ref_digest)
+            self._template_digests[name] = russell.cache.digest(*parts)
+        return self._template_digests[name]
+
+    def cached_fragment(self, key, *deps, caller):
+        """
+        Render part of a template once per build, and reuse it on every page
+        that renders it with the same key and dependencies. Available to
+        templates as a global to be used with a call block:
+
+            {% call cached_fragment("sidebar", tags) %}...{% endcall %}
+
+        Args:
+          key (str): A name for the fragment, unique across templates.
+          *deps: Every value the fragment depends on, apart from template
+            globals. If any of them can't be fingerprinted, the fragment is
+            rendered every time.
+          caller: The body of the call block, passed in by jinja.
+        """
+        deps_fingerprint = russell.cache.fingerprint(list(deps))
+        if deps_fingerprint is None:
+            LOG.debug("not caching fragment %r, unknown dependencies", key)
+            return caller()
+        cache_key = (key, deps_fingerprint)
+        if cache_key not in self._fragments:
+            self._fragments[cache_key] = caller()
+        return self._fragments[cache_key]
+
+    def _get_posts_dirs(self):
+        return [path for path, kind in self._content_dirs.items() if kind == "posts"]
+
+    def _get_page_inputs(self, template, kwargs):
+        """
+        Get the inputs of the dependency graph that a page depends on: its
+        template, the source files of any content passed to the template, and
+        the directories of posts if it lists posts.
+        """
+        inputs = {GLOBALS_INPUT}
+        if not isinstance(template, str):
+            template = getattr(template, "name", None)
+        if template:
+            inputs.add(self._get_template_info(template)[1])
+        for value in kwargs.values():
+            items = value if isinstance(value, (list, tuple)) else [value]
+            if isinstance(value, (list, tuple)) and any(
+                isinstance(item, russell.content.Post) for item in items
+            ):
+                inputs.update(self._get_posts_dirs())
+            for item in items:
+                source_path = getattr(item, "source_path", None)
+                if source_path:
+                    inputs.add(source_path)
+        return inputs
+
+    def _get_render_key(self, template, kwargs):
+        """
+        Get a key which identifies everything that goes into rendering a page:
+        the template (and templates it depends on), the template globals and
+        the variables passed to the template. Returns None if any of these
+        can't be fingerprinted, in which case the page must always be rendered.
+        """
+        if not isinstance(template, str):
+            template = getattr(template, "name", None)
+            if template is None:
+                return None
+        template_digest = self._get_template_digest(template)
+        if template_digest is None:
+            return None
+
+        globals_fingerprint = self._get_globals_fingerprint()
+        if globals_fingerprint is None:
+            return None
+        context = russell.cache.fingerprint(kwargs)
+        if context is None:
+            return None
+        return russell.cache.digest(template_digest, globals_fingerprint, context)
+
+    def _get_globals_fingerprint(self):
+        """
+        Get a fingerprint of the template globals and of any custom filters and
+        tests. Fingerprinting the tags and asset hashes is expensive, so it is
+        only done again when the posts or pages change, a global, filter or
+        test is replaced, or after add_asset_hashes or reload.
+
+        Custom functions may look up content, like a global listing the latest
+        posts, so if there are any, the fingerprint includes every post and
+        page as well.
+        """
+        # (values, jinja's defaults, russell's own functions)
+        environments = (
+            (self.jinja.globals, {}, self._builtin_globals),
+            (self.jinja.filters, jinja2.defaults.DEFAULT_FILTERS, {}),
+            (self.jinja.tests, jinja2.defaults.DEFAULT_TESTS, {}),
+        )
+        check = (
+            self.cm.index,
+            tuple(
+                (key, id(value))
+                for values, _, _ in environments
+                for key, value in values.items()
+            ),
+        )
+        if self._globals_fingerprint and self._globals_fingerprint[0] == check:
+            return self._globals_fingerprint[1]
+
+        parts = []
+        has_custom_functions = False
+        for values, defaults, builtins in environments:
+            fingerprints = {}
+            for key, value in values.items():
+                if defaults.get(key) is value:
+                    continue
+                if key == "now":
+                    # only consider the date, otherwise nothing would be cached
+                    value = value.date()
+                elif callable(value):
+                    if builtins.get(key) is not value:
+                        has_custom_functions = True
+                    value = self._get_callable_fingerprint(value)
+                fingerprints[key] = value
+            parts.append(fingerprints)
+        if has_custom_functions:
+            parts.append(self.cm.index.fingerprint)
+            parts.append([page.fingerprint for page in self.pages])
+        fingerprint = russell.cache.fingerprint(parts)
+        self._globals_fingerprint = (check, fingerprint)
+        return fingerprint
+
+    def _get_callable_fingerprint(self, value):
+        """
+        Get a fingerprint of a function used by templates: its name and a
+        digest of the file it is defined in, so that editing a helper in
+        config.py changes it.
+        """
+        if isinstance(value, functools.partial):
+            args = russell.cache.fingerprint([list(value.args), value.keywords])
+            return "%s(%s)" % (self._get_callable_fingerprint(value.func), args)
+        func = getattr(value, "__func__", value)
+        name = getattr(func, "__qualname__", None) or type(func).__qualname__
+        try:
+            path = inspect.getsourcefile(func)
+        except TypeError:
+            # builtins have no source
+            path = None
+        if not path:
+            return name
+        if path not in self._source_digests:
+            try:
+                with open(path, "rb") as file:
+                    self._source_digests[path] = russell.cache.digest(file.read())
+            except OSError:
+                self._source_digests[path] = None
+        return "%s:%s" % (name, self._source_digests[path])
+
+    @profiled
     def generate_pages(self):
         """
         Generate HTML out of the pages added to the blog.
         """
-        for page in self.pages:
-            self.generate_page(page.slug, template="page.html.jinja", page=page)
+        self._generate_many(
+            (page.slug, "page.html.jinja", {"page": page}) for page in self.pages
+        )
 
+    @profiled
     def generate_posts(self):
         """
         Generate single-post HTML files out of posts added to the blog. Will not
         generate front page, archives or tag files - those have to be generated
         separately.
         """
-        for post in self.posts:
-            self.generate_page(
-                ["posts", post.slug],
-                template="post.html.jinja",
-                post=post,
-            )
+        self._generate_many(
+            (["posts", post.slug], "post.html.jinja", {"post": post})
+            for post in self.posts
+        )
 
-    def generate_tags(self):
+    @profiled
+    def generate_tags(self, per_page=None):
         """
         Generate one HTML page for each tag, each containing all posts that
         match that tag.
+
+        Args:
+          per_page (int): Optional. If provided, split each tag's posts into
+            pages of this many posts, at tags/<slug>/page/<n>.
+        """
+        self._generate_many(
+            page
+            for tag in self.tags
+            for page in self._paginate(
+                ["tags", tag.slug],
+                "archive.html.jinja",
+                self.get_posts(tag=tag, private=True),
+                per_page,
+            )
+        )
+
+    def _paginate(self, path, template, posts, per_page, **kwargs):
+        """
+        Split a list of posts into pages. Yields (path, template, kwargs)
+        tuples for _generate_many, lazily, so when rendering serially each
+        page's posts are only sliced out of the list when the page is about to
+        be generated. Extra kwargs are passed on to the template.
+
+        The first page is at the given path, the following ones at
+        <path>/page/<n>. If per_page is falsy, all posts go on one page.
         """
-        for tag in self.tags:
-            posts = self.get_posts(tag=tag, private=True)
-            self.generate_page(
-                ["tags", tag.slug], template="archive.html.jinja", posts=posts
+        if isinstance(path, str):
+            path = [path]
+        if not per_page:
+            yield (path, template, dict(kwargs, posts=posts))
+            return
+
+        # index pages live at the root of their directory, so their following
+        # pages do too
+        base_path = path[:-1] if path[-1] == "index" else path
+        num_pages = max(1, math.ceil(len(posts) / per_page))
+
+        def get_url(page):
+            if page == 1:
+                if not base_path:
+                    # the root index, which must not get an empty URL when
+                    # root_url is empty
+                    return self.root_url + "/"
+                return "/".join([self.root_url] + base_path)
+            return "/".join([self.root_url] + base_path + ["page", str(page)])
+
+        for page in range(1, num_pages + 1):
+            page_path = path if page == 1 else base_path + ["page", str(page)]
+            pagination = Pagination(page, num_pages, get_url)
+            page_posts = posts[(page - 1) * per_page : page * per_page]
+            yield (
+                page_path,
+                template,
+                dict(kwargs, posts=page_posts, pagination=pagination),
             )
 
+    @profiled
     def generate_page(self, path, template, **kwargs):
         """
         Generate the HTML for a single page. You usually don't need to call this
@@ -262,6 +1031,27 @@ class BlogEngine:
             the `page` kwarg is passed, its directory attribute will be
             prepended to the path.
         """
+        page = self._prepare_page(path, template, kwargs)
+        if page:
+            self._write_page(page, self._render_page(page))
+
+    def _render_page(self, page):
+        start = time.perf_counter()
+        html = page.template.render(**page.kwargs)
+        self._record_render(page, time.perf_counter() - start)
+        return html
+
+    def _record_render(self, page, seconds):
+        self.profiler.record_output(
+            self.output.relpath(page.path), page.template.name, seconds
+        )
+
+    def _prepare_page(self, path, template, kwargs):
+        """
+        Figure out where a page should be written, and whether it needs to be
+        rendered at all. Returns a PendingPage, or None if the page is
+        unchanged since the last build.
+        """
         directory = None
         if kwargs.get("page"):
             directory = kwargs["page"].dir
@@ -270,30 +1060,185 @@ class BlogEngine:
         if not path.endswith(".html"):
             path = path + ".html"
 
-        if not os.path.isdir(os.path.dirname(path)):
-            os.makedirs(os.path.dirname(path))
+        cache_key = os.path.relpath(path, self._get_dist_path([]))
+        # pages which were always rendered, because they couldn't be
+        # fingerprinted, may depend on things the dependency graph doesn't know
+        # about, so they are never assumed to be clean
+        if self.cache.get("renders", cache_key) and self._is_clean(cache_key):
+            return None
+        self.deps.set_inputs(cache_key, self._get_page_inputs(template, kwargs))
+        render_key = self._get_render_key(template, kwargs)
+        if (
+            render_key is not None
+            and os.path.exists(path)
+            and self.cache.get("renders", cache_key) == render_key
+        ):
+            self.output.skip(path)
+            return None
+
+        template = self._get_template(template)
+        return PendingPage(path, cache_key, render_key, template, kwargs)
+
+    def _write_page(self, page, html):
+        self.output.write(page.path, html)
+        if page.render_key is not None:
+            self.cache.set("renders", page.cache_key, page.render_key)
+        if self.evict_bodies:
+            for entry in _get_entries([page]):
+                entry.evict()
+
+    def _generate_many(self, pages):
+        """
+        Generate many pages, rendering them in parallel if render_workers is
+        set. Pages are always written in the order given. When rendering in
+        parallel, if any of them fail to render, the rest are still written
+        before a RenderError is raised.
+
+        Args:
+          pages (iterable): (path, template, kwargs) tuples, see generate_page.
+            When rendering serially, each page is prepared, rendered and
+            written before the next one is taken from the iterable.
+        """
+        if self.render_workers < 2:
+            for path, template, kwargs in pages:
+                page = self._prepare_page(path, template, kwargs)
+                if page:
+                    self._write_page(page, self._render_page(page))
+            return
+
+        pending = []
+        for path, template, kwargs in pages:
+            page = self._prepare_page(path, template, kwargs)
+            if page:
+                pending.append(page)
 
-        html = self._get_template(template).render(**kwargs)
+        if len(pending) < 2:
+            for page in pending:
+                self._write_page(page, self._render_page(page))
+            return
 
-        with open(path, "w+") as file:
-            file.write(html)
+        errors = {}
+        for page, (html, error, seconds) in zip(
+            pending, self._render_parallel(pending)
+        ):
+            self._record_render(page, seconds)
+            if error is not None:
+                LOG.error("failed to render %r: %s", page.path, error)
+                errors[page.path] = error
+            else:
+                self._write_page(page, html)
+        if errors:
+            raise RenderError(errors)
 
-    def generate_index(self, num_posts=5, exclude_tags=None):
+    def _render_parallel(self, pending):
+        """
+        Render pending pages in a pool of workers. Returns a list of (html,
+        error) tuples in the same order as the pages.
+        """
+        global _pending_pages  # pylint: disable=global-statement
+        workers = self.render_workers
+        # render markdown up front, as anything the workers render is lost
+        self.cm.render_entries(_get_entries(pending), workers=workers)
+        num_chunks = min(len(pending), workers * 4)
+        chunks = [range(idx, len(pending), num_chunks) for idx in range(num_chunks)]
+
+        if russell.content.can_fork():
+            pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("fork")
+            )
+        else:
+            pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+        results = [None] * len(pending)
+        _pending_pages = pending
+        try:
+            with pool:
+                for chunk, chunk_results in zip(
+                    chunks, pool.map(_render_pending_pages, chunks)
+                ):
+                    for idx, result in zip(chunk, chunk_results):
+                        results[idx] = result
+        finally:
+            _pending_pages = []
+        return results
+
+    @profiled
+    def generate_index(self, num_posts=5, exclude_tags=None, paginate=False):
         """
         Generate the front page, aka index.html.
+
+        Args:
+          num_posts (int): How many posts to show.
+          exclude_tags (set): Optional. Don't show posts with these tags.
+          paginate (bool): If True, show all posts, num_posts at a time, with
+            the following pages at page/<n>.
         """
-        posts = self.get_posts(num=num_posts, exclude_tags=None)
-        self.generate_page("index", template="index.html.jinja", posts=posts)
+        if paginate:
+            posts = self.get_posts(exclude_tags=exclude_tags)
+            self._generate_many(
+                self._paginate("index", "index.html.jinja", posts, num_posts)
+            )
+        else:
+            posts = self.get_posts(num=num_posts, exclude_tags=exclude_tags)
+            self.generate_page("index", template="index.html.jinja", posts=posts)
 
-    def generate_archive(self):
+    @profiled
+    def generate_archive(self, per_page=None):
         """
         Generate the archive HTML page.
+
+        Args:
+          per_page (int): Optional. If provided, split the archive into pages
+            of this many posts, at archive/page/<n>.
         """
-        self.generate_page(
-            "archive", template="archive.html.jinja", posts=self.get_posts()
+        self._generate_many(
+            self._paginate("archive", "archive.html.jinja", self.get_posts(), per_page)
         )
 
-    def generate_rss(self, path="rss.xml", only_excerpt=True, https=False):
+    @profiled
+    def generate_date_archives(
+        self, template="archive.html.jinja", months=True, per_page=None
+    ):
+        """
+        Generate an archive page for each year, at <year>/index.html, and
+        optionally each month, at <year>/<month>/index.html, that has public
+        posts. Posts are grouped by the content manager's post index, which
+        is built in a single pass over the sorted posts. Templates get the
+        `year` and `month` (None for year pages) variables in addition to
+        `posts`.
+
+        As with other pages, archives whose posts haven't changed are not
+        rendered again, so changing a post's pubdate only re-renders the
+        archives it moved from and to.
+
+        Args:
+          template (str): Which jinja template to use.
+          months (bool): Whether to generate monthly archives.
+          per_page (int): Optional. If provided, paginate the archives.
+        """
+        index = self.cm.index
+        pages = [
+            self._paginate(
+                [str(year), "index"], template, posts, per_page, year=year, month=None
+            )
+            for year, posts in index.by_year.items()
+        ]
+        if months:
+            pages.extend(
+                self._paginate(
+                    [str(year), "%02d" % month, "index"],
+                    template,
+                    posts,
+                    per_page,
+                    year=year,
+                    month=month,
+                )
+                for (year, month), posts in index.by_month.items()
+            )
+        self._generate_many(page for year_pages in pages for page in year_pages)
+
+    @profiled
+    def generate_rss(self, path="rss.xml", only_excerpt=True, https=False, **kwargs):
         """
         Generate the RSS feed.
 
@@ -306,38 +1251,274 @@ class BlogEngine:
           https (bool): If True, links inside the RSS with relative scheme (e.g.
             //example.com/something) will be set to HTTPS. If False (the
             default), they will be set to plain HTTP.
+
+        Other kwargs are passed on to generate_feed.
+        """
+        self.generate_feed(
+            path, feed_format="rss", only_excerpt=only_excerpt, https=https, **kwargs
+        )
+
+    @profiled
+    def generate_feed(
+        self,
+        path="rss.xml",
+        feed_format="rss",
+        only_excerpt=True,
+        https=False,
+        max_entries=None,
+        tag=None,
+    ):
+        """
+        Generate an RSS or Atom feed. The feed is written to disk one entry at
+        a time, and is left alone if its contents haven't changed.
+
+        Args:
+          path (str): Where to save the feed.
+          feed_format (str): "rss" or "atom".
+          only_excerpt (bool): See generate_rss.
+          https (bool): See generate_rss.
+          max_entries (int): Optional. Only include this many of the newest
+            posts.
+          tag (Tag or str): Optional. Only include posts with this tag.
+        """
+        if self._is_clean(path):
+            return
+        posts = self.get_posts(num=max_entries, tag=tag)
+        if tag and isinstance(tag, str):
+            tag = self.cm.get_tag(tag) or self.cm.Tag(tag)
+        entries = (
+            russell.feed.render_entry(post, feed_format, only_excerpt, https)
+            for post in posts
+        )
+        self._write_feed(path, feed_format, https, posts, entries, tag=tag)
+
+    @profiled
+    def generate_feeds(
+        self,
+        path="rss.xml",
+        tag_path="tags/{slug}.xml",
+        feed_format="rss",
+        only_excerpt=True,
+        https=False,
+        max_entries=None,
+    ):
         """
-        feed = russell.feed.get_rss_feed(self, only_excerpt=only_excerpt, https=https)
-        feed.rss_file(self._get_dist_path(path))
+        Generate the main feed as well as a feed for every tag, in a single
+        pass over the posts. Each post's entry is only rendered once, no
+        matter how many feeds it's in.
+
+        Args:
+          path (str): Where to save the main feed.
+          tag_path (str): Where to save the feeds of tags. "{slug}" is replaced
+            with the slug of the tag.
+          feed_format (str): "rss" or "atom".
+          only_excerpt (bool): See generate_rss.
+          https (bool): See generate_rss.
+          max_entries (int): Optional. Only include this many of the newest
+            posts in each feed.
+        """
+        # (post, entry) tuples for each feed, keyed by tag slug, or None for
+        # the main feed
+        feeds = {None: []}
+        feeds.update((tag.slug, []) for tag in self.tags)
+        clean = {
+            slug
+            for slug in feeds
+            if self._is_clean(path if slug is None else tag_path.format(slug=slug))
+        }
+        for post in self.get_posts():
+            # tags with different names can share a slug, like "C++" and "C#"
+            slugs = dict.fromkeys([None] + [tag.slug for tag in post.tags])
+            slugs = [slug for slug in slugs if slug not in clean]
+            if max_entries is not None:
+                slugs = [slug for slug in slugs if len(feeds[slug]) < max_entries]
+            if not slugs:
+                continue
+            entry = russell.feed.render_entry(post, feed_format, only_excerpt, https)
+            for slug in slugs:
+                feeds[slug].append((post, entry))
+
+        for slug, items in feeds.items():
+            if slug in clean:
+                continue
+            posts = [post for post, _ in items]
+            entries = (entry for _, entry in items)
+            if slug is None:
+                self._write_feed(path, feed_format, https, posts, entries)
+            else:
+                tag = self.cm.get_tag(slug)
+                feed_path = tag_path.format(slug=slug)
+                self._write_feed(feed_path, feed_format, https, posts, entries, tag)
 
-    def generate_sitemap(self, path="sitemap.xml", https=False):
+    def _write_feed(self, path, feed_format, https, posts, entries, tag=None):
+        title = self.site_title
+        link = self.root_url
+        if tag:
+            title = "%s - %s" % (self.site_title, tag.title)
+            link = tag.url
+        updated = max((post.pubdate for post in posts if post.pubdate), default=None)
+
+        with self.output.open(self._get_dist_path(path)) as file:
+            writer = russell.feed.FeedWriter(file, feed_format)
+            writer.start(
+                title=title,
+                link=russell.content.schema_url(link, https),
+                description=self.site_desc or self.site_title,
+                feed_url=russell.content.schema_url(self.root_url + "/" + path, https),
+                updated=updated,
+            )
+            for entry in entries:
+                writer.write_entry(entry)
+            writer.finish()
+
+        self.deps.set_inputs(
+            path,
+            [post.source_path for post in posts if post.source_path]
+            + self._get_posts_dirs(),
+        )
+
+    @profiled
+    def generate_sitemap(
+        self,
+        path="sitemap.xml",
+        https=False,
+        index_path="sitemap_index.xml",
+        max_urls=russell.sitemap.MAX_URLS,
+        compress=False,
+    ):
         """
-        Generate an XML sitemap.
+        Generate an XML sitemap. The sitemap is written to disk one URL at a
+        time. If there are more URLs than fit in one sitemap, they are split
+        across several files, named like sitemap-1.xml, sitemap-2.xml and so
+        on, and a sitemap index listing them is written to index_path.
 
         Args:
           path (str): The name of the file to write to.
           https (bool): If True, links inside the sitemap with relative scheme
             (e.g. example.com/something) will be set to HTTPS. If False (the
             default), they will be set to plain HTTP.
+          index_path (str): Where to write the sitemap index, if one is needed.
+          max_urls (int): How many URLs to put in one sitemap at most.
+          compress (bool): If True, gzip the sitemaps, and add .gz to their
+            names.
         """
-        sitemap = russell.sitemap.generate_sitemap(self, https=https)
-        self.write_file(path, sitemap)
+        num_urls = 1 + len(self.tags) + len(self.cm.index.public)
+        num_urls += sum(1 for page in self.pages if page.public)
+        urls = russell.sitemap.get_urls(self, https=https)
+        ext = ".gz" if compress else ""
 
+        if num_urls <= max_urls:
+            paths = [path + ext]
+            self._write_sitemap(paths[0], urls, compress)
+        else:
+            root, path_ext = os.path.splitext(path)
+            shards = []
+            while urls is not None:
+                shard_path = "%s-%d%s%s" % (root, len(shards) + 1, path_ext, ext)
+                lastmod, urls = self._write_sitemap(
+                    shard_path, urls, compress, max_urls
+                )
+                shards.append((shard_path, lastmod))
+            paths = [index_path + ext] + [shard_path for shard_path, _ in shards]
+            with self._open_output(paths[0], compress) as file:
+                writer = russell.sitemap.SitemapWriter(file, index=True)
+                for shard_path, lastmod in shards:
+                    loc = "%s/%s" % (self.root_url, shard_path)
+                    loc = russell.content.schema_url(loc, https)
+                    writer.write_sitemap(loc, lastmod)
+                writer.finish()
+
+        inputs = [
+            entry.source_path for entry in self.pages + self.posts if entry.source_path
+        ] + list(self._content_dirs)
+        for output_path in paths:
+            self.deps.set_inputs(output_path, inputs)
+
+    def _write_sitemap(self, path, urls, compress=False, max_urls=None):
+        """
+        Write URLs to a sitemap until they run out, or until the sitemap is
+        full if max_urls is given.
+
+        Returns a tuple of the latest lastmod of the URLs written, and an
+        iterator of the URLs that didn't fit, or None if they all did.
+        """
+        urls = iter(urls)
+        latest = None
+        with self._open_output(path, compress) as file:
+            writer = russell.sitemap.SitemapWriter(file)
+            for loc, lastmod, changefreq in urls:
+                url = russell.sitemap.render_url(loc, lastmod, changefreq)
+                if max_urls and not writer.can_fit(url, max_urls):
+                    writer.finish()
+                    leftover = ((loc, lastmod, changefreq),)
+                    return latest, itertools.chain(leftover, urls)
+                writer.write_url(url)
+                if lastmod and (latest is None or lastmod > latest):
+                    latest = lastmod
+            writer.finish()
+        return latest, None
+
+    @contextlib.contextmanager
+    def _open_output(self, path, compress=False):
+        with self.output.open(self._get_dist_path(path)) as file:
+            if not compress:
+                yield file
+                return
+            # a fixed mtime in the gzip header keeps unchanged files identical
+            with gzip.GzipFile(fileobj=file, mode="wb", mtime=0) as gzip_file:
+                yield gzip_file
+
+    @profiled
     def write_file(self, path, contents):
         """
         Write a file of any type to the destination path. Useful for files like
-        robots.txt, manifest.json, and so on.
+        robots.txt, manifest.json, and so on. If the file already exists with
+        the same contents, it is left alone.
 
         Args:
           path (str): The name of the file to write to.
           contents (str or bytes): The contents to write.
         """
-        path = self._get_dist_path(path)
-        if not os.path.isdir(os.path.dirname(path)):
-            os.makedirs(os.path.dirname(path))
-        if isinstance(contents, bytes):
-            mode = "wb+"
-        else:
-            mode = "w"
-        with open(path, mode) as file:
-            file.write(contents)
+        self.output.write(self._get_dist_path(path), contents)
+
+    def finish(self, prune=False):
+        """
+        Finish the build. Call this at the end of your generate function, so
+        that the build cache and the manifest of generated files are saved for
+        the next run.
+
+        Args:
+          prune (bool): If True, remove files in the destination directory
+            which were not generated during this build, for example pages of
+            posts which have since been deleted or renamed.
+
+        Returns a dict of lists of files that were "added", "changed" or
+        "removed" compared to the previous build, which can be used to decide
+        what to upload when deploying.
+        """
+        if prune:
+            self.output.prune()
+        diff = self.output.diff()
+        self.output.save()
+        self.cm.keep_cached_markdown(self.pages + self.posts)
+        self.cache.save()
+        self._fragments.clear()
+        self._clean_outputs = set()
+        LOG.info("build finished: %s", self.output.summary())
+        self._report_profile()
+        return diff
+
+    def _report_profile(self):
+        if not self.profiler.enabled:
+            return
+        self.profiler.stop()
+        if isinstance(self.profile, str):
+            self.profiler.save(self.profile)
+            LOG.info("saved build profile to %r", self.profile)
+        elif self.profile:
+            LOG.info("build profile:\n%s", self.profiler.summary())
+        if self.cprofile:
+            self.profiler.save_python_profile(self.cprofile)
+            LOG.info("saved cProfile of the build to %r", self.cprofile)
+        # in watch mode, the next build starts now
+        self.profiler.reset()
@@ -1,6 +1,16 @@
+import datetime
+import email.utils
+from xml.sax.saxutils import escape, quoteattr
+
 from feedgen.feed import FeedGenerator
 from russell.content import schema_url
 
+FEED_FORMATS = ("rss", "atom")
+
+# atom requires an <updated> date for feeds and entries. when there are no
+# pubdates to use, a fixed date keeps the output from changing between builds
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
 
 def get_rss_feed(blog, only_excerpt=True, https=False):
     generator = FeedGenerator()
@@ -12,15 +22,7 @@ def get_rss_feed(blog, only_excerpt=True, https=False):
     generator.subtitle(blog.site_desc or blog.site_title)
 
     for post in blog.get_posts():
-        if only_excerpt:
-            read_more = (
-                'Read the full article at <a href="%s" target="_blank">%s</a>'
-                % (post.url, post.url)
-            )
-            body = "<p>%s</p><p>%s</p>" % (post.excerpt, read_more)
-        else:
-            body = post.body
-
+        body = _get_entry_body(post, only_excerpt)
         post_href = schema_url(post.url, https=https)
 
         entry = generator.add_entry()
@@ -31,3 +33,136 @@ def get_rss_feed(blog, only_excerpt=True, https=False):
         entry.published(post.pubdate)
 
     return generator
+
+
+def _get_entry_body(post, only_excerpt):
+    if not only_excerpt:
+        return post.body
+    read_more = 'Read the full article at <a href="%s" target="_blank">%s</a>' % (
+        post.url,
+        post.url,
+    )
+    return "<p>%s</p><p>%s</p>" % (post.excerpt, read_more)
+
+
+def render_entry(post, feed_format="rss", only_excerpt=True, https=False):
+    """
+    Render a post as an RSS <item> or Atom <entry> element. The result can be
+    written to any number of feeds of the same format with FeedWriter.
+
+    Args:
+      post (Post): The post.
+      feed_format (str): "rss" or "atom".
+      only_excerpt (bool): If True, only include the post's excerpt and a
+        link to the full post.
+      https (bool): Whether to use https for links without a scheme.
+    """
+    href = schema_url(post.url, https=https)
+    body = escape(_get_entry_body(post, only_excerpt))
+    if feed_format == "atom":
+        dates = "<updated>%s</updated>" % EPOCH.isoformat()
+        if post.pubdate:
+            dates = "<updated>{0}</updated><published>{0}</published>".format(
+                post.pubdate.isoformat()
+            )
+        return (
+            '<entry><id>%s</id><title>%s</title>%s<link href=%s rel="alternate"/>'
+            '<summary type="html">%s</summary></entry>'
+            % (escape(href), escape(post.title), dates, quoteattr(href), body)
+        )
+    pubdate = ""
+    if post.pubdate:
+        pubdate = "<pubDate>%s</pubDate>" % email.utils.format_datetime(post.pubdate)
+    return (
+        "<item><title>%s</title><link>%s</link><description>%s</description>"
+        '<guid isPermaLink="false">%s</guid>%s</item>'
+        % (escape(post.title), escape(href), body, escape(href), pubdate)
+    )
+
+
+class FeedWriter:
+    """
+    Writes an RSS 2.0 or Atom feed to a file one entry at a time, so that the
+    whole feed never has to be held in memory.
+
+    The output only depends on the feed's metadata and entries, not on when
+    it was generated, so that an unchanged feed can be detected and left
+    alone.
+    """
+
+    def __init__(self, file, feed_format="rss"):
+        """
+        Constructor.
+
+        Args:
+          file: A file-like object with a write method that accepts strings.
+          feed_format (str): "rss" or "atom".
+        """
+        if feed_format not in FEED_FORMATS:
+            raise ValueError("unknown feed format: %r" % feed_format)
+        self.file = file
+        self.feed_format = feed_format
+
+    def start(self, title, link, description, feed_url, updated=None):
+        """
+        Write everything that comes before the entries.
+
+        Args:
+          title (str): Title of the feed.
+          link (str): URL of the website the feed is for.
+          description (str): Description of the feed.
+          feed_url (str): URL of the feed itself.
+          updated (datetime): When the feed was last updated, usually the
+            pubdate of the newest entry. Atom feeds without it get EPOCH.
+        """
+        self.file.write("<?xml version='1.0' encoding='UTF-8'?>\n")
+        if self.feed_format == "atom":
+            self.file.write(
+                '<feed xmlns="http://www.w3.org/2005/Atom"><id>%s</id>'
+                '<title>%s</title>%s<link href=%s rel="alternate"/>'
+                '<link href=%s rel="self"/><author><name>%s</name></author>'
+                "<subtitle>%s</subtitle>"
+                % (
+                    escape(link),
+                    escape(title),
+                    "<updated>%s</updated>" % (updated or EPOCH).isoformat(),
+                    quoteattr(link),
+                    quoteattr(feed_url),
+                    escape(title),
+                    escape(description),
+                )
+            )
+        else:
+            self.file.write(
+                '<rss xmlns:atom="http://www.w3.org/2005/Atom" version="2.0">'
+                "<channel><title>%s</title><link>%s</link>"
+                "<description>%s</description>"
+                '<atom:link href=%s rel="self" type="application/rss+xml"/>%s'
+                % (
+                    escape(title),
+                    escape(link),
+                    escape(description),
+                    quoteattr(feed_url),
+                    (
+                        "<lastBuildDate>%s</lastBuildDate>"
+                        % email.utils.format_datetime(updated)
+                        if updated
+                        else ""
+                    ),
+                )
+            )
+
+    def write_entry(self, entry):
+        """
+        Write an entry rendered by render_entry.
+        """
+        self.file.write(entry)
+
+    def finish(self):
+        """
+        Write everything that comes after the entries.
+        """
+        if self.feed_format == "atom":
+            self.file.write("</feed>\n")
+        else:
+            self.file.write("</channel></rss>\n")
@@ -0,0 +1,378 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import os.path
+import shutil
+import threading
+
+from russell.cache import hash_file
+
+LOG = logging.getLogger(__name__)
+
+# the ioctl for cloning a file on linux, see ioctl_ficlone(2)
+FICLONE = 0x40049409
+
+
+def _reflink(src, dest):
+    """
+    Make a copy-on-write clone of a file, on filesystems that support it
+    (btrfs, xfs...). Falls back to copy_file_range, which lets the kernel copy
+    the data without passing it through userspace, and then a regular copy.
+    """
+    with open(src, "rb") as src_file, open(dest, "wb") as dest_file:
+        try:
+            import fcntl  # pylint: disable=import-outside-toplevel
+
+            fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+            return
+        except (ImportError, OSError):
+            pass
+        if hasattr(os, "copy_file_range"):
+            try:
+                remaining = os.fstat(src_file.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(
+                        src_file.fileno(), dest_file.fileno(), remaining
+                    )
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                if remaining <= 0:
+                    return
+            except OSError:
+                pass
+    shutil.copyfile(src, dest)
+
+
+class _HashingFile:
+    """
+    Wraps a binary file to keep track of the hash and size of what is written
+    to it. Strings are encoded as UTF-8.
+    """
+
+    def __init__(self, file):
+        self._file = file
+        self.hasher = hashlib.sha1()
+        self.size = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._file.write(data)
+        self.hasher.update(data)
+        self.size += len(data)
+
+
+class OutputWriter:
+    """
+    Writes generated files to disk, but only if their contents have changed.
+    Unchanged files are left alone so that their mtime stays the same, which
+    keeps tools like rsync from transferring them again.
+
+    Files are written atomically, by writing to a temporary file next to the
+    destination and renaming it, so a half-written file is never served.
+
+    Every file produced during a build is recorded in a manifest, with its
+    size and SHA1 hash. The manifest can be saved, compared with the one from
+    the previous build, and used to prune files that are no longer generated.
+    """
+
+    def __init__(self, root, manifest_path=None, full=False):
+        """
+        Constructor.
+
+        Args:
+          root (str): The directory files are written to.
+          manifest_path (str): Where to save the manifest. If None, the
+            manifest is only kept in memory.
+          full (bool): If True, ignore the manifest of the previous build.
+        """
+        self.root = root
+        self.manifest_path = manifest_path
+        self.manifest = {}
+        self.previous = {}
+        if manifest_path and not full and os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, "r") as file:
+                    self.previous = json.load(file)["files"]
+            except (ValueError, KeyError):
+                LOG.warning("could not read manifest %r, ignoring it", manifest_path)
+
+        self.written = 0
+        self.unchanged = 0
+        self.removed = 0
+        # copy() may be called from several threads at once
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """
+        Start a new build with the same writer. The manifest of the build so
+        far becomes the previous manifest.
+        """
+        self.previous = self.manifest
+        self.manifest = {}
+        self.written = 0
+        self.unchanged = 0
+        self.removed = 0
+
+    def relpath(self, path):
+        """
+        Get the path of a file relative to the output directory.
+        """
+        return os.path.relpath(path, self.root)
+
+    def write(self, path, contents):
+        """
+        Write a file if its contents differ from what's already on disk.
+
+        Args:
+          path (str): Full path of the file.
+          contents (str or bytes): The contents to write. Strings are encoded
+            as UTF-8.
+
+        Returns True if the file was written, False if it was unchanged.
+        """
+        if isinstance(contents, str):
+            contents = contents.encode("utf-8")
+        relpath = self.relpath(path)
+        sha1 = hashlib.sha1(contents).hexdigest()
+
+        if self._is_unchanged(path, relpath, len(contents), sha1, contents):
+            LOG.debug("%r is unchanged, not writing it", path)
+            self._record(path, relpath, sha1)
+            self.unchanged += 1
+            return False
+
+        directory, filename = os.path.split(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_path = os.path.join(directory, ".%s.tmp" % filename)
+        with open(tmp_path, "wb") as file:
+            file.write(contents)
+        os.replace(tmp_path, path)
+        LOG.debug("wrote %r", path)
+        self._record(path, relpath, sha1)
+        self.written += 1
+        return True
+
+    @contextlib.contextmanager
+    def open(self, path):
+        """
+        Write a file in pieces, for files too large to build in memory first.
+        Used as a context manager, which gives a file-like object with a write
+        method accepting strings or bytes. The contents go to a temporary
+        file, which only replaces the destination if the contents differ from
+        what's already on disk.
+
+        Args:
+          path (str): Full path of the file.
+        """
+        directory, filename = os.path.split(path)
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, ".%s.tmp" % filename)
+        try:
+            with open(tmp_path, "wb") as file:
+                hashing_file = _HashingFile(file)
+                yield hashing_file
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        relpath = self.relpath(path)
+        sha1 = hashing_file.hasher.hexdigest()
+        if self._is_unchanged(path, relpath, hashing_file.size, sha1):
+            LOG.debug("%r is unchanged, not writing it", path)
+            os.remove(tmp_path)
+            self.unchanged += 1
+        else:
+            os.replace(tmp_path, path)
+            LOG.debug("wrote %r", path)
+            self.written += 1
+        self._record(path, relpath, sha1)
+
+    def copy(self, src, path, link=None):
+        """
+        Copy a file, unless an identical copy is already in place. The copy
+        gets the same mtime as the source file, so that the next build can
+        tell it's unchanged without reading it. Safe to call from multiple
+        threads at once.
+
+        Args:
+          src (str): Path of the file to copy.
+          path (str): Full path of the destination.
+          link (str): None to make a regular copy, "hard" to make a hard link,
+            or "reflink" to make a copy-on-write clone where the filesystem
+            supports it.
+
+        Returns True if the file was copied, False if it was unchanged.
+        """
+        src_stat = os.stat(src)
+        if self._is_same_file(src, path, src_stat):
+            LOG.debug("%r is unchanged, not copying it", path)
+            with self._lock:
+                self.record(path)
+                self.unchanged += 1
+            return False
+
+        directory, filename = os.path.split(path)
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, ".%s.tmp" % filename)
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        if link == "hard":
+            os.link(src, tmp_path)
+        elif link == "reflink":
+            _reflink(src, tmp_path)
+        else:
+            shutil.copyfile(src, tmp_path)
+        if link != "hard":
+            os.utime(tmp_path, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+        os.replace(tmp_path, path)
+        LOG.debug("copied %r to %r", src, path)
+        with self._lock:
+            self.record(path)
+            self.written += 1
+        return True
+
+    @staticmethod
+    def _is_same_file(src, path, src_stat):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if os.path.samestat(src_stat, stat):
+            return True
+        if stat.st_size != src_stat.st_size:
+            return False
+        if stat.st_mtime_ns == src_stat.st_mtime_ns:
+            return True
+        if hash_file(src) != hash_file(path):
+            return False
+        # same contents, so just bring the mtime in line to avoid hashing the
+        # files again next time
+        os.utime(path, ns=(stat.st_atime_ns, src_stat.st_mtime_ns))
+        return True
+
+    def skip(self, path):
+        """
+        Record that a file was not generated because it is known to be
+        unchanged.
+        """
+        LOG.debug("%r is unchanged, skipping it", path)
+        self.record(path)
+        self.unchanged += 1
+
+    def record(self, path):
+        """
+        Record a file which was produced without going through the writer,
+        for example by copying it, in the manifest.
+        """
+        relpath = self.relpath(path)
+        stat = os.stat(path)
+        previous = self.previous.get(relpath)
+        if self._matches_stat(previous, stat):
+            self.manifest[relpath] = previous
+        else:
+            self._record(path, relpath, hash_file(path), stat)
+
+    def remove(self, path):
+        """
+        Remove a file that is no longer generated.
+        """
+        LOG.debug("removing %r", path)
+        os.remove(path)
+        self.manifest.pop(self.relpath(path), None)
+        self.removed += 1
+
+    def _record(self, path, relpath, sha1, stat=None):
+        stat = stat or os.stat(path)
+        self.manifest[relpath] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "sha1": sha1,
+        }
+
+    @staticmethod
+    def _matches_stat(entry, stat):
+        return (
+            entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime"] == stat.st_mtime_ns
+        )
+
+    def _is_unchanged(self, path, relpath, size, sha1, contents=None):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_size != size:
+            return False
+        # if the file hasn't been touched since the last build, we can trust
+        # the hash in the manifest instead of reading the file
+        previous = self.previous.get(relpath)
+        if self._matches_stat(previous, stat):
+            return previous["sha1"] == sha1
+        if contents is None:
+            return hash_file(path) == sha1
+        with open(path, "rb") as file:
+            return file.read() == contents
+
+    def prune(self):
+        """
+        Remove every file in the output directory which was not produced
+        during this build, as well as any directories left empty.
+        """
+        for root, dirs, files in os.walk(self.root, topdown=False):
+            for file in files:
+                path = os.path.join(root, file)
+                if self.relpath(path) not in self.manifest:
+                    self.remove(path)
+            for directory in dirs:
+                path = os.path.join(root, directory)
+                if not os.listdir(path):
+                    LOG.debug("removing empty directory %r", path)
+                    os.rmdir(path)
+
+    def diff(self):
+        """
+        Compare this build's manifest with the previous one.
+
+        Returns a dict with sorted lists of relative paths that were "added",
+        "changed" and "removed".
+        """
+        added, changed = [], []
+        for relpath, entry in self.manifest.items():
+            previous = self.previous.get(relpath)
+            if previous is None:
+                added.append(relpath)
+            elif previous["sha1"] != entry["sha1"]:
+                changed.append(relpath)
+        removed = [relpath for relpath in self.previous if relpath not in self.manifest]
+        return {
+            "added": sorted(added),
+            "changed": sorted(changed),
+            "removed": sorted(removed),
+        }
+
+    def save(self):
+        """
+        Save the manifest, if it has a path.
+        """
+        if not self.manifest_path:
+            return
+        directory = os.path.dirname(self.manifest_path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"files": self.manifest}, file, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def summary(self):
+        return "%d files written, %d unchanged, %d removed" % (
+            self.written,
+            self.unchanged,
+            self.removed,
+        )
@@ -0,0 +1,196 @@
+import cProfile
+import contextlib
+import functools
+import json
+import time
+
+
+def profiled(method):
+    """
+    Decorator for BlogEngine methods, which times every call as a phase of the
+    build named after the method.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.profiler.phase(method.__name__):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class _Timing:
+    __slots__ = ("seconds", "calls")
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+
+    def add(self, seconds):
+        self.seconds += seconds
+        self.calls += 1
+
+    def to_dict(self):
+        return {"seconds": round(self.seconds, 6), "calls": self.calls}
+
+
+class BuildProfiler:
+    """
+    Records how long the phases of a build take (adding posts, generating
+    pages, feeds and so on), how long markdown conversion and rendering each
+    output takes, and optionally a cProfile of the whole build.
+
+    When disabled, all of the methods do next to nothing, so the engine can
+    call them unconditionally.
+    """
+
+    def __init__(self, enabled=False, cprofile=False):
+        """
+        Constructor.
+
+        Args:
+          enabled (bool): Whether to record timings at all.
+          cprofile (bool): Whether to also run cProfile during the build.
+        """
+        self.enabled = enabled or cprofile
+        self.python_profile = None
+        if cprofile:
+            self.python_profile = cProfile.Profile()
+        self.reset()
+
+    def reset(self):
+        """
+        Forget all timings, and start timing a new build.
+        """
+        self.phases = {}
+        self.timers = {}
+        self.templates = {}
+        self.outputs = []
+        self._depth = 0
+        self._start = time.perf_counter()
+        # set by stop(), until then to_dict() reports the time so far
+        self.total = None
+        if self.python_profile:
+            self.python_profile.enable()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Time a phase of the build. Phases started during another phase are
+        counted as part of the outer one only, so that phase times add up.
+        """
+        if not self.enabled or self._depth:
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+            return
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            self.phases.setdefault(name, _Timing()).add(time.perf_counter() - start)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """
+        Time something which may happen during any phase, like converting
+        markdown.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers.setdefault(name, _Timing()).add(time.perf_counter() - start)
+
+    def record_output(self, path, template, seconds):
+        """
+        Record how long it took to render an output with a template.
+        """
+        if not self.enabled:
+            return
+        self.outputs.append((seconds, path, template))
+        self.templates.setdefault(template, _Timing()).add(seconds)
+
+    def stop(self):
+        """
+        Stop timing the build.
+        """
+        self.total = time.perf_counter() - self._start
+        if self.python_profile:
+            self.python_profile.disable()
+
+    def to_dict(self, top=10):
+        """
+        Get the timings as a JSON serializable dict, with the `top` slowest
+        outputs and templates.
+        """
+        templates = sorted(
+            self.templates.items(), key=lambda item: item[1].seconds, reverse=True
+        )
+        total = self.total
+        if total is None:
+            total = time.perf_counter() - self._start
+        return {
+            "total": round(total, 6),
+            "phases": {name: timing.to_dict() for name, timing in self.phases.items()},
+            "timers": {name: timing.to_dict() for name, timing in self.timers.items()},
+            "slowest_templates": [
+                dict(timing.to_dict(), template=name)
+                for name, timing in templates[:top]
+            ],
+            "slowest_outputs": [
+                {"path": path, "template": template, "seconds": round(seconds, 6)}
+                for seconds, path, template in sorted(self.outputs, reverse=True)[:top]
+            ],
+        }
+
+    def summary(self, top=10):
+        """
+        Get a human readable summary of the timings.
+        """
+        data = self.to_dict(top)
+        lines = ["build took %.3fs" % data["total"]]
+        for title, timings in (("phases", data["phases"]), ("timers", data["timers"])):
+            if timings:
+                lines.append("%s:" % title)
+            for name, timing in sorted(
+                timings.items(), key=lambda item: item[1]["seconds"], reverse=True
+            ):
+                lines.append(
+                    "  %-24s %8.3fs %6d calls"
+                    % (name, timing["seconds"], timing["calls"])
+                )
+        if data["slowest_templates"]:
+            lines.append("slowest templates:")
+        for timing in data["slowest_templates"]:
+            lines.append(
+                "  %-24s %8.3fs %6d renders"
+                % (timing["template"], timing["seconds"], timing["calls"])
+            )
+        if data["slowest_outputs"]:
+            lines.append("slowest outputs:")
+        for output in data["slowest_outputs"]:
+            lines.append("  %-40s %8.3fs" % (output["path"], output["seconds"]))
+        return "\n".join(lines)
+
+    def save(self, path, top=10):
+        """
+        Save the timings as JSON.
+        """
+        with open(path, "w") as file:
+            json.dump(self.to_dict(top), file, indent=2)
+
+    def save_python_profile(self, path):
+        """
+        Save the cProfile stats, which can be read with the pstats module or
+        tools like snakeviz.
+        """
+        if self.python_profile:
+            self.python_profile.dump_stats(path)
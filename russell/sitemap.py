@@ -1,6 +1,16 @@
+from datetime import datetime
+import os.path
 from xml.etree import ElementTree as etree
+from xml.sax.saxutils import escape
+
 from russell.content import schema_url
 
+# limits of a single sitemap file, according to the sitemaps protocol
+MAX_URLS = 50000
+MAX_BYTES = 50 * 1024 * 1024
+
+XMLNS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
 
 def text_element(tag, text):
     elem = etree.Element(tag)
@@ -55,3 +65,96 @@ class SitemapGenerator:
 
 def generate_sitemap(blog, https=True):
     return SitemapGenerator(blog, https).generate_sitemap()
+
+
+def get_urls(blog, https=True):
+    """
+    Get the URLs of a blog to put in its sitemap, lazily, as (loc, lastmod,
+    changefreq) tuples. lastmod is a date or None.
+
+    Pages get the modification time of their source file, tags and the index
+    get the pubdate of their newest post, and posts get their pubdate.
+    """
+    index = blog.cm.index
+    newest = index.public[0].pubdate if index.public else None
+    yield (schema_url(blog.root_url, https), _get_date(newest), "daily")
+    for page in blog.pages:
+        if page.public:
+            lastmod = None
+            if page.source_path and os.path.exists(page.source_path):
+                lastmod = datetime.fromtimestamp(os.path.getmtime(page.source_path))
+            yield (schema_url(page.url, https), _get_date(lastmod), "monthly")
+    for tag in blog.tags:
+        posts = index.public_by_tag.get(tag.slug)
+        lastmod = posts[0].pubdate if posts else None
+        yield (schema_url(tag.url, https), _get_date(lastmod), "weekly")
+    for post in index.public:
+        yield (schema_url(post.url, https), _get_date(post.pubdate), "monthly")
+
+
+def _get_date(value):
+    return value.date() if value else None
+
+
+def render_url(loc, lastmod=None, changefreq=None):
+    """
+    Render a <url> element of a sitemap.
+    """
+    parts = ["<url><loc>%s</loc>" % escape(loc)]
+    if lastmod:
+        parts.append("<lastmod>%s</lastmod>" % lastmod.isoformat())
+    if changefreq:
+        parts.append("<changefreq>%s</changefreq>" % changefreq)
+    parts.append("</url>")
+    return "".join(parts)
+
+
+class SitemapWriter:
+    """
+    Writes a sitemap, or a sitemap index, to a file one URL at a time.
+    """
+
+    def __init__(self, file, index=False):
+        """
+        Constructor.
+
+        Args:
+          file: A file-like object with a write method that accepts bytes.
+          index (bool): If True, write a sitemap index instead of a sitemap.
+        """
+        self.file = file
+        self.tag = "sitemapindex" if index else "urlset"
+        self.num_urls = 0
+        self.size = 0
+        self._write("<?xml version='1.0' encoding='utf-8'?>\n")
+        self._write('<%s xmlns="%s">' % (self.tag, XMLNS))
+
+    def _write(self, data):
+        data = data.encode("utf-8")
+        self.file.write(data)
+        self.size += len(data)
+
+    def can_fit(self, url, max_urls=MAX_URLS, max_bytes=MAX_BYTES):
+        """
+        Check if a rendered URL can be written without going over the limits
+        of a sitemap file, keeping room for the closing tag.
+        """
+        size = self.size + len(url.encode("utf-8")) + len(self.tag) + 4
+        return self.num_urls < max_urls and size <= max_bytes
+
+    def write_url(self, url):
+        self._write(url)
+        self.num_urls += 1
+
+    def write_sitemap(self, loc, lastmod=None):
+        """
+        Write a <sitemap> element of a sitemap index.
+        """
+        parts = ["<sitemap><loc>%s</loc>" % escape(loc)]
+        if lastmod:
+            parts.append("<lastmod>%s</lastmod>" % lastmod.isoformat())
+        parts.append("</sitemap>")
+        self.write_url("".join(parts))
+
+    def finish(self):
+        self._write("</%s>\n" % self.tag)
@@ -0,0 +1,23 @@
+import json
+import os.path
+import subprocess
+import sys
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(__file__))
+
+
+@pytest.mark.slow
+def test_benchmark_smoke(tmp_path):
+    site_dir = tmp_path / "site"
+    output = subprocess.check_output(
+        [sys.executable, "-m", "benchmarks", "--posts=5", "--tags=3", "--assets=2"]
+        + ["--pages=1", "--code-blocks=1", "--site-dir", str(site_dir), "--json"],
+        cwd=REPO_ROOT,
+    )
+    results = json.loads(output)
+    assert list(results) == ["cold", "noop", "edit"]
+    assert results["cold"]["posts"] == 5
+    assert results["cold"]["output_bytes"] > 0
+    assert results["noop"]["changed_files"] == 0
+    assert results["edit"]["changed_files"] >= 1
@@ -0,0 +1,101 @@
+from datetime import datetime
+
+from russell.cache import BuildCache, digest, fingerprint
+from russell.content import Post
+
+
+def test_digest_is_stable_and_separates_parts():
+    assert digest("a", "b") == digest("a", "b")
+    assert digest("ab") != digest("a", "b")
+    assert digest(b"a") == digest("a")
+
+
+def test_fingerprint_of_plain_values():
+    assert fingerprint({"a": [1, "b"], "c": None}) == fingerprint(
+        {"c": None, "a": [1, "b"]}
+    )
+    assert fingerprint(datetime(2020, 1, 1)) == "2020-01-01T00:00:00"
+
+
+def test_fingerprint_of_unknown_values_is_none():
+    assert fingerprint(object()) is None
+    assert fingerprint([1, object()]) is None
+
+
+def test_fingerprint_of_posts():
+    post = Post.from_string("# Hello\n\nWorld")
+    assert fingerprint([post]) is not None
+    assert fingerprint(Post("Hello", "World")) is None
+
+
+def test_cache_persists_between_instances(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = BuildCache(path)
+    cache.set("section", "key", "value")
+    cache.save()
+    assert BuildCache(path).get("section", "key") == "value"
+    assert BuildCache(path, full=True).get("section", "key") is None
+
+
+def test_cache_drops_unused_entries_on_save(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = BuildCache(path)
+    cache.set("section", "old", 1)
+    cache.set("other", "key", 2)
+    cache.save()
+
+    cache = BuildCache(path)
+    cache.set("section", "new", 3)
+    cache.save()
+
+    cache = BuildCache(path)
+    assert cache.get("section", "old") is None
+    assert cache.get("section", "new") == 3
+    assert cache.get("other", "key") == 2
+
+
+def test_file_sections_store_one_file_per_entry(tmp_path):
+    path = str(tmp_path / "cache.json")
+    key, other_key = digest("a"), digest("b")
+    cache = BuildCache(path, file_sections=("blobs",))
+    cache.set("blobs", key, "value")
+    cache.set("blobs", other_key, "other value")
+    cache.save()
+    assert (tmp_path / "blobs" / key[:2] / key[2:]).exists()
+    assert "value" not in (tmp_path / "cache.json").read_text()
+
+    cache = BuildCache(path, file_sections=("blobs",))
+    assert cache.get("blobs", key) == "value"
+    assert (
+        BuildCache(path, full=True, file_sections=("blobs",)).get("blobs", key) is None
+    )
+    # only the entry that was looked up is kept
+    cache.save()
+    assert not (tmp_path / "blobs" / other_key[:2]).exists()
+    assert BuildCache(path, file_sections=("blobs",)).get("blobs", key) == "value"
+
+
+def test_clearing_file_sections(tmp_path):
+    cache = BuildCache(str(tmp_path / "cache.json"), file_sections=("blobs",))
+    cache.set("blobs", digest("a"), "value")
+    cache.clear()
+    assert cache.get("blobs", digest("a")) is None
+    cache.set("blobs", digest("a"), "new value")
+    assert cache.get("blobs", digest("a")) == "new value"
+
+
+def test_kept_entries_are_not_dropped_on_save(tmp_path):
+    path = str(tmp_path / "cache.json")
+    key, other_key = digest("a"), digest("b")
+    cache = BuildCache(path, file_sections=("blobs",))
+    cache.set("blobs", key, "value")
+    cache.set("blobs", other_key, "other value")
+    cache.save()
+
+    cache = BuildCache(path, file_sections=("blobs",))
+    cache.get("blobs", key)
+    cache.keep("blobs", other_key)
+    cache.save()
+    assert BuildCache(path, file_sections=("blobs",)).get("blobs", other_key) == (
+        "other value"
+    )
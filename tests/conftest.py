@@ -1,5 +1,6 @@
 import pytest
 import os.path
+import shutil
 from russell.engine import BlogEngine
 
 
@@ -23,3 +24,16 @@ def pytest_collection_modifyitems(config, items):
 def engine():
     root_path = os.path.dirname(__file__)
     return BlogEngine(root_path, "//localhost", "Test Blog")
+
+
+@pytest.fixture
+def site_engine(tmp_path):
+    """
+    An engine with the example templates, rooted in a temporary directory so
+    that it can actually generate files.
+    """
+    example_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "example")
+    shutil.copytree(os.path.join(example_dir, "templates"), tmp_path / "templates")
+    (tmp_path / "posts").mkdir()
+    (tmp_path / "pages").mkdir()
+    return BlogEngine(str(tmp_path), "//localhost", "Test Blog", cache_dir=".cache")
@@ -1,4 +1,7 @@
 from datetime import datetime
+import os
+import sys
+import threading
 
 from russell.content import (
     ContentManager,
@@ -6,8 +9,10 @@ from russell.content import (
     Page,
     Tag,
     CaseInsensitiveDict,
+    get_markdown_cache_key,
     schema_url,
 )
+import russell.content
 
 
 def test_basic_parsing():
@@ -102,6 +107,23 @@ def test_content_manager_root_url():
     assert post.url == "//example.com/posts/hello-world"
 
 
+def test_urls_and_tag_links_follow_root_url_changes():
+    cm = ContentManager(root_url="//example.com")
+    post = cm.Post.from_string("# Hello world!\ntags: Foo\n\nThis is a test post.")
+    assert post.url == "//example.com/posts/hello-world"
+    links = post.tag_links
+    links.append("<a>extra</a>")
+    assert post.tag_links == ['<a href="//example.com/tags/foo">Foo</a>']
+    cm.root_url = "https://example.org"
+    assert post.url == "https://example.org/posts/hello-world"
+    assert post.tags[0].url == "https://example.org/tags/foo"
+    assert post.tag_links == ['<a href="https://example.org/tags/foo">Foo</a>']
+    post.slug = "hello"
+    post.tags = [cm.make_tag("Bar")]
+    assert post.url == "https://example.org/posts/hello"
+    assert post.tag_links == ['<a href="https://example.org/tags/bar">Bar</a>']
+
+
 def test_content_manager_tags():
     cm = ContentManager(root_url="//example.com")
     md = "# Hello world!\ntags:Foo Bar, Bar Baz\n\nThis is a test post."
@@ -159,6 +181,14 @@ def test_tag_sorting():
 def test_tag_equality():
     assert Tag("Test Tag") == "test-tag"
     assert Tag("Test Tag") == "Test Tag"
+    assert Tag("C++") == "c++"
+    assert Tag("Test Tag") != "other"
+
+
+def test_tag_not_equal_to_other_types():
+    assert Tag("1") != 1
+    assert not Tag("1") == 1
+    assert Tag("None") != None  # noqa: E711
 
 
 def test_post_has_tag():
@@ -196,3 +226,203 @@ def test_schema_url_changes_schema_agnostic_urls_to_http_or_https():
 
 def test_schema_url_does_not_change_existing_schema_urls():
     assert "http://example.com" == schema_url("http://example.com", https=True)
+
+
+def make_indexed_posts():
+    cm = ContentManager(root_url="//example.com")
+    a, b = Tag("Tag A"), Tag("Tag B")
+    cm.add_posts(
+        [
+            Post("p1", "", pubdate=datetime(2016, 3, 1), tags=[a]),
+            Post("p2", "", pubdate=datetime(2016, 2, 1), tags=[a, b], public=False),
+            Post("p3", "", pubdate=datetime(2015, 2, 1), tags=[b]),
+        ]
+    )
+    return cm
+
+
+def test_content_manager_get_posts_by_tag():
+    cm = make_indexed_posts()
+    assert [p.title for p in cm.get_posts(tag="tag-a")] == ["p1"]
+    assert [p.title for p in cm.get_posts(tag="Tag A", private=True)] == ["p1", "p2"]
+    assert [p.title for p in cm.get_posts(tag=Tag("Tag B"))] == ["p3"]
+    assert cm.get_posts(tag="nope") == []
+
+
+def test_content_manager_get_posts_excluding_tags():
+    cm = make_indexed_posts()
+    assert [p.title for p in cm.get_posts(exclude_tags=["tag a"])] == ["p3"]
+    assert [p.title for p in cm.get_posts(exclude_tags={"tag-b"}, private=True)] == [
+        "p1"
+    ]
+
+
+def test_content_manager_get_posts_returns_copies():
+    cm = make_indexed_posts()
+    cm.get_posts().clear()
+    assert len(cm.get_posts(num=1)) == 1
+    assert len(cm.get_posts()) == 2
+    # like None, 0 means no limit
+    assert len(cm.get_posts(num=0)) == 2
+
+
+def test_post_index_by_date():
+    index = make_indexed_posts().index
+    assert [p.title for p in index.by_year[2016]] == ["p1"]
+    assert [p.title for p in index.by_month[(2015, 2)]] == ["p3"]
+
+
+def test_content_manager_index_is_rebuilt_when_posts_change():
+    cm = make_indexed_posts()
+    assert len(cm.get_posts()) == 2
+    cm.remove_posts(cm.get_posts(num=1))
+    assert [p.title for p in cm.get_posts()] == ["p3"]
+
+
+def test_tags_are_hashable_by_slug():
+    assert len({Tag("Test Tag"), Tag("test tag"), Tag("Other")}) == 2
+    assert Tag("Test Tag") in {Tag("test-tag")}
+
+
+def test_content_manager_tags_are_unique_by_slug():
+    cm = ContentManager(root_url="//example.com")
+    post1 = cm.Post.from_string("# One\ntags: Foo Bar\n\nOne")
+    post2 = cm.Post.from_string("# Two\ntags: foo-bar, Baz\n\nTwo")
+    cm.add_posts([post1, post2])
+    assert [tag.title for tag in post2.tags] == ["foo-bar", "Baz"]
+    assert [tag.slug for tag in cm.tags] == ["baz", "foo-bar"]
+    assert cm.get_tag("foo-bar") is post1.tags[0]
+    assert cm.get_tag("FOO BAR") is post1.tags[0]
+    assert cm.get_tag("nope") is None
+
+    cm.remove_posts([post2])
+    assert cm.get_tag("baz") is None
+
+
+def test_tags_with_the_same_slug_keep_their_titles():
+    cm = ContentManager(root_url="//example.com")
+    post = cm.Post.from_string("# One\ntags: C++, C#, c#\n\nOne")
+    assert [tag.title for tag in post.tags] == ["C++", "C#"]
+    assert post.tag_links == [
+        '<a href="//example.com/tags/c">C++</a>',
+        '<a href="//example.com/tags/c">C#</a>',
+    ]
+
+
+def test_markdown_is_rendered_lazily():
+    cm = ContentManager("//localhost")
+    post = cm.Post.from_string("# Hello world!\n\nThis is a test post.")
+    assert post.markdown == "This is a test post."
+    assert post.get_unrendered() == [
+        ("body", "This is a test post."),
+        ("excerpt", "This is a test post."),
+    ]
+    assert post.excerpt == "<p>This is a test post.</p>"
+    assert post.get_unrendered() == [("body", "This is a test post.")]
+    assert post.body == "<p>This is a test post.</p>"
+    assert post.get_unrendered() == []
+
+
+def test_render_entries():
+    cm = ContentManager("//localhost")
+    posts = [cm.Post.from_string("# Post %d\n\nPost %d." % (i, i)) for i in range(3)]
+    cm.render_entries(posts, workers=2)
+    assert [post.get_unrendered() for post in posts] == [[], [], []]
+    assert posts[2].body == "<p>Post 2.</p>"
+
+
+def test_post_with_html_body():
+    post = Post("Hello", "<p>Hi there</p>")
+    assert post.body == "<p>Hi there</p>"
+    assert post.excerpt == "<p>Hi there</p>"
+    assert post.get_unrendered() == []
+
+
+def test_scan_file(tmp_path):
+    path = tmp_path / "hello.md"
+    path.write_text(
+        "# Hello world!\npubdate: 2020-01-02 03:04 UTC\ntags: Foo, Bar\n"
+        "private: true\n\nThis is a test post.\n"
+    )
+    cm = ContentManager("//localhost")
+    header = cm.Post.scan_file(str(path))
+    assert header.title == "Hello world!"
+    assert header.slug == "hello"
+    assert header.pubdate.isoformat() == "2020-01-02T03:04:00+00:00"
+    assert header.tags == ("Foo", "Bar")
+    assert header.public is False
+    assert header.mtime == path.stat().st_mtime_ns
+    # scanning doesn't register tags
+    assert "foo" not in cm.tags_dict
+
+
+def test_pubdate_parsing_formats():
+    for pubdate, expected in (
+        ("2020-01-02 03:04 UTC", "2020-01-02T03:04:00+00:00"),
+        ("2020-01-02T03:04:05+02:00", "2020-01-02T03:04:05+02:00"),
+        ("January 2, 2020 03:04 UTC", "2020-01-02T03:04:00+00:00"),
+    ):
+        post = Post.from_string("# Hello\npubdate: %s\n\nBody" % pubdate)
+        assert post.pubdate.isoformat() == expected
+
+
+def test_content_is_slotted():
+    cm = ContentManager("//localhost")
+    post = cm.Post.from_string("# Hello\ntags: Foo\n\nWorld")
+    for obj in (post, post.tags[0], cm.Page.from_string("# Hello\n\nWorld")):
+        assert not hasattr(obj, "__dict__")
+
+
+def test_description_defaults_to_start_of_body():
+    post = Post.from_string("# Hello\n\nFirst sentence. Second sentence.\n\nMore.")
+    assert post.description == "First sentence. Second sentence."
+    post = Post.from_string("# Hello\ndescription: Custom\n\nFirst sentence.")
+    assert post.description == "Custom"
+
+
+def test_evict():
+    post = Post.from_string("# Hello\n\nWorld")
+    assert post.body == "<p>World</p>"
+    post.evict()
+    assert len(post.get_unrendered()) == 2
+    assert post.body == "<p>World</p>"
+    post = Post("Hello", "<p>World</p>")
+    post.evict()
+    assert post.body == "<p>World</p>"
+
+
+def test_markdown_cache_key_depends_on_extensions(monkeypatch):
+    key = get_markdown_cache_key("Hello")
+    assert get_markdown_cache_key("Hello") == key
+    monkeypatch.setattr(russell.content, "MARKDOWN_EXTENSIONS", ["extra"])
+    assert get_markdown_cache_key("Hello") != key
+
+
+def test_no_forking_while_other_threads_run():
+    assert russell.content.can_fork() == sys.platform.startswith("linux")
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    try:
+        assert not russell.content.can_fork()
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_markdown_is_not_rendered_in_forked_processes_while_threads_run(
+    monkeypatch,
+):
+    forks = []
+    fork = os.fork
+    monkeypatch.setattr(os, "fork", lambda: forks.append(1) or fork())
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    try:
+        html = russell.content.render_markdown_many(["a", "b", "c"], workers=2)
+    finally:
+        stop.set()
+        thread.join()
+    assert html == ["<p>a</p>", "<p>b</p>", "<p>c</p>"]
+    assert forks == []
@@ -0,0 +1,27 @@
+from russell.depgraph import DependencyGraph
+
+
+def test_dirty_outputs_of_changed_input():
+    graph = DependencyGraph()
+    graph.set_inputs("a.html", ["a.md", "post.jinja"])
+    graph.set_inputs("b.html", ["b.md", "post.jinja"])
+    assert graph.dirty(["a.md"]) == {"a.html"}
+    assert graph.dirty(["post.jinja"]) == {"a.html", "b.html"}
+    assert graph.dirty(["c.md"]) == set()
+
+
+def test_dirty_follows_dependencies_between_inputs():
+    graph = DependencyGraph()
+    graph.add_dependency("post.jinja", "layout.jinja")
+    graph.add_dependency("layout.jinja", "macros.jinja")
+    graph.set_inputs("a.html", ["post.jinja"])
+    graph.set_inputs("b.html", ["page.jinja"])
+    assert graph.dirty(["macros.jinja"]) == {"a.html"}
+
+
+def test_set_inputs_replaces_previous_inputs():
+    graph = DependencyGraph()
+    graph.set_inputs("a.html", ["a.md"])
+    graph.set_inputs("a.html", ["b.md"])
+    assert graph.dirty(["a.md"]) == set()
+    assert graph.get_inputs("a.html") == {"b.md"}
@@ -1,5 +1,14 @@
-from russell.content import Post, Tag
-from russell.engine import make_link
+import gzip
+import json
+import multiprocessing
+import os.path
+import sys
+
+import pytest
+
+from russell.content import Post, Tag, get_markdown_cache_key
+import russell.content
+from russell.engine import BlogEngine, RenderError, TemplateError, make_link
 
 
 def test_make_link(engine):
@@ -48,3 +57,613 @@ def test_get_posts_exclude_tags(engine):
     posts = engine.get_posts(exclude_tags=["b"])
     assert len(posts) == 1
     assert posts[0].title == "test post 1"
+
+
+def make_post(engine, body, title="Hello", pubdate="2020-01-01 00:00 UTC", tags=""):
+    md = "# %s\npubdate: %s\ntags: %s\n\n%s" % (title, pubdate, tags, body)
+    return engine.cm.Post.from_string(md)
+
+
+def read_dist(engine, path):
+    with open(os.path.join(engine.root_path, "dist", path)) as file:
+        return file.read()
+
+
+def test_generate_page_skips_unchanged_pages(site_engine):
+    site_engine.cm.add_posts([make_post(site_engine, "World")])
+    site_engine.generate_posts()
+    path = os.path.join(site_engine.root_path, "dist", "posts", "hello.html")
+    with open(path, "w") as file:
+        file.write("not re-rendered")
+    site_engine.generate_posts()
+    assert read_dist(site_engine, "posts/hello.html") == "not re-rendered"
+
+
+def test_generate_page_rerenders_changed_pages(site_engine):
+    site_engine.cm.add_posts([make_post(site_engine, "World")])
+    site_engine.generate_posts()
+    site_engine.posts[0] = make_post(site_engine, "Changed")
+    site_engine.generate_posts()
+    assert "Changed" in read_dist(site_engine, "posts/hello.html")
+
+
+def test_build_cache_is_used_by_new_engine(site_engine):
+    site_engine.cm.add_posts([make_post(site_engine, "World")])
+    site_engine.generate_posts()
+    site_engine.finish()
+
+    engine = BlogEngine(
+        site_engine.root_path, "//localhost", "Test Blog", cache_dir=".cache"
+    )
+    assert (
+        engine.cache.get("markdown", get_markdown_cache_key("World")) == "<p>World</p>"
+    )
+
+
+def test_add_posts_in_parallel(site_engine):
+    for idx in range(4):
+        with open(
+            os.path.join(site_engine.root_path, "posts", "%d.md" % idx), "w"
+        ) as file:
+            file.write("# Post %d\ntags: Foo, Bar\n\nBody %d" % (idx, idx))
+    site_engine.add_posts(parallel=True, workers=2)
+    assert sorted(post.body for post in site_engine.posts) == [
+        "<p>Body %d</p>" % idx for idx in range(4)
+    ]
+    assert len(site_engine.tags) == 2
+    foo_tags = {id(post.tags[0]) for post in site_engine.posts}
+    assert len(foo_tags) == 1
+
+
+def test_parallel_rendering_matches_serial_rendering(site_engine):
+    site_engine.cm.add_posts(
+        [
+            make_post(site_engine, "Body %d" % idx, title="Post %d" % idx)
+            for idx in range(5)
+        ]
+    )
+    site_engine.generate_posts()
+    serial = [read_dist(site_engine, "posts/post-%d.html" % idx) for idx in range(5)]
+
+    site_engine.cache.clear()
+    site_engine.render_workers = 2
+    site_engine.generate_posts()
+    parallel = [read_dist(site_engine, "posts/post-%d.html" % idx) for idx in range(5)]
+    assert serial == parallel
+
+
+@pytest.mark.parametrize("platform", ["darwin", "win32"])
+def test_parallel_rendering_uses_threads_unless_on_linux(
+    site_engine, monkeypatch, platform
+):
+    monkeypatch.setattr(sys, "platform", platform)
+    get_context = multiprocessing.get_context
+
+    def get_context_without_fork(method=None):
+        assert method != "fork"
+        return get_context(method)
+
+    monkeypatch.setattr(multiprocessing, "get_context", get_context_without_fork)
+    site_engine.cm.add_posts([make_post(site_engine, "", title=t) for t in "ab"])
+    site_engine.render_workers = 2
+    site_engine.generate_posts()
+    assert "a" in read_dist(site_engine, "posts/a.html")
+
+
+def test_serial_rendering_writes_each_page_before_taking_the_next(site_engine):
+    posts = [make_post(site_engine, "", title=t) for t in "ab"]
+    dist_path = os.path.join(site_engine.root_path, "dist", "posts", "a.html")
+
+    def pages():
+        yield (["posts", "a"], "post.html.jinja", {"post": posts[0]})
+        assert os.path.exists(dist_path)
+        yield (["posts", "b"], "post.html.jinja", {"post": posts[1]})
+
+    site_engine._generate_many(pages())
+    assert "b" in read_dist(site_engine, "posts/b.html")
+
+
+def test_parallel_rendering_reports_errors_per_page(site_engine):
+    with open(
+        os.path.join(site_engine.root_path, "templates", "post.html.jinja"), "w"
+    ) as file:
+        file.write("{% if post.title == 'Bad' %}{{ post.nope.nope }}{% endif %}ok")
+    site_engine.cm.add_posts(
+        [make_post(site_engine, "", title=title) for title in ("Good", "Bad")]
+    )
+    site_engine.render_workers = 2
+    with pytest.raises(RenderError) as excinfo:
+        site_engine.generate_posts()
+    assert list(excinfo.value.errors) == [
+        os.path.join(site_engine.root_path, "dist", "posts", "bad.html")
+    ]
+    assert read_dist(site_engine, "posts/good.html") == "ok"
+
+
+def test_finish_prunes_output_of_removed_posts(site_engine):
+    site_engine.cm.add_posts([make_post(site_engine, "", title=t) for t in "ab"])
+    site_engine.generate_posts()
+    site_engine.finish()
+
+    engine = BlogEngine(
+        site_engine.root_path, "//localhost", "Test Blog", cache_dir=".cache"
+    )
+    engine.cm.add_posts([make_post(engine, "", title="a")])
+    engine.generate_posts()
+    diff = engine.finish(prune=True)
+    posts_dir = os.path.join(engine.root_path, "dist", "posts")
+    assert os.listdir(posts_dir) == ["a.html"]
+    assert diff == {"added": [], "changed": [], "removed": ["posts/b.html"]}
+
+
+def write_source(engine, path, contents):
+    path = os.path.join(engine.root_path, path)
+    with open(path, "w") as file:
+        file.write(contents)
+    return path
+
+
+def test_reload_replaces_changed_and_removes_deleted_posts(site_engine):
+    path_a = write_source(site_engine, "posts/a.md", "# A\ntags: Old\n\nA")
+    path_b = write_source(site_engine, "posts/b.md", "# B\n\nB")
+    site_engine.add_posts()
+    write_source(site_engine, "posts/a.md", "# A\ntags: New\n\nChanged")
+    os.remove(path_b)
+
+    site_engine.reload([path_a, path_b])
+    assert [post.body for post in site_engine.posts] == ["<p>Changed</p>"]
+    assert [tag.title for tag in site_engine.tags] == ["New"]
+
+
+def test_reload_adds_new_pages(site_engine):
+    site_engine.add_pages()
+    os.mkdir(os.path.join(site_engine.root_path, "pages", "sub"))
+    path = write_source(site_engine, "pages/sub/about.md", "# About\n\nMe")
+    site_engine.reload([path])
+    assert [(page.slug, page.dir) for page in site_engine.pages] == [("about", "sub")]
+
+
+def test_dependency_graph_of_generated_pages(site_engine):
+    write_source(site_engine, "posts/a.md", "# A\npubdate: 2020-01-02\n\nA")
+    path_b = write_source(site_engine, "posts/b.md", "# B\npubdate: 2020-01-01\n\nB")
+    site_engine.add_posts()
+    site_engine.generate_posts()
+    site_engine.generate_index(num_posts=1)
+    site_engine.generate_archive()
+    site_engine.generate_rss()
+
+    assert site_engine.deps.dirty([path_b]) == {
+        "posts/b.html",
+        "archive.html",
+        "rss.xml",
+    }
+    layout = os.path.join(site_engine.root_path, "templates", "layout.html.jinja")
+    assert site_engine.deps.dirty([layout]) == {
+        "posts/a.html",
+        "posts/b.html",
+        "index.html",
+        "archive.html",
+    }
+
+
+def test_reload_returns_outputs_affected_by_changes(site_engine):
+    path_a = write_source(site_engine, "posts/a.md", "# A\npubdate: 2020-01-02\n\nA")
+    write_source(site_engine, "posts/b.md", "# B\npubdate: 2020-01-01\n\nB")
+    site_engine.add_posts()
+    site_engine.generate_posts()
+    site_engine.generate_index(num_posts=1)
+
+    write_source(site_engine, "posts/a.md", "# A\npubdate: 2020-01-02\n\nChanged")
+    assert site_engine.reload([path_a]) == {"posts/a.html", "index.html"}
+
+    path_c = write_source(site_engine, "posts/c.md", "# C\npubdate: 2020-01-03\n\nC")
+    assert site_engine.reload([path_c]) == {"index.html"}
+
+
+def test_generate_after_reload_only_prepares_affected_outputs(site_engine):
+    path_a = write_source(site_engine, "posts/a.md", "# A\npubdate: 2020-01-02\n\nA")
+    write_source(site_engine, "posts/b.md", "# B\npubdate: 2020-01-01\n\nB")
+
+    def generate():
+        site_engine.add_posts()
+        site_engine.generate_posts()
+        site_engine.generate_index(num_posts=1)
+        site_engine.generate_feeds()
+        return site_engine.finish(prune=True)
+
+    generate()
+    write_source(site_engine, "posts/a.md", "# A\npubdate: 2020-01-02\n\nChanged")
+    site_engine.reload([path_a])
+    prepared = []
+    get_render_key = site_engine._get_render_key
+    site_engine._get_render_key = lambda template, kwargs: (
+        prepared.append(kwargs) or get_render_key(template, kwargs)
+    )
+    diff = generate()
+    assert len(site_engine.posts) == 2
+    assert [sorted(kwargs) for kwargs in prepared] == [["post"], ["posts"]]
+    assert prepared[0]["post"].title == "A"
+    assert diff["changed"] == ["index.html", "posts/a.html", "rss.xml"]
+    assert diff["removed"] == []
+    assert "Changed" in read_dist(site_engine, "posts/a.html")
+
+
+def write_asset(engine, path, contents):
+    path = os.path.join(engine.root_path, "dist", "assets", path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        file.write(contents)
+    return path
+
+
+def test_add_asset_hashes(site_engine):
+    write_asset(site_engine, "style.css", "body{}")
+    write_asset(site_engine, "js/app.js", "")
+    site_engine.add_asset_hashes()
+    assert site_engine.asset_hash == {
+        "style.css": "aa676972bbd2b68e94ef8e91e81d20be",
+        "js/app.js": "d41d8cd98f00b204e9800998ecf8427e",
+    }
+
+
+def test_add_asset_hashes_with_blake2b(site_engine):
+    write_asset(site_engine, "style.css", "body{}")
+    site_engine.add_asset_hashes(algorithm="blake2b")
+    assert len(site_engine.asset_hash["style.css"]) == 16
+
+
+def test_add_asset_hashes_reuses_cached_hashes(site_engine):
+    path = write_asset(site_engine, "style.css", "body{}")
+    site_engine.add_asset_hashes()
+    stat = os.stat(path)
+    write_asset(site_engine, "style.css", "html{}")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    site_engine.add_asset_hashes()
+    # same size and mtime, so the file is assumed to be unchanged
+    assert site_engine.asset_hash["style.css"] == "aa676972bbd2b68e94ef8e91e81d20be"
+
+
+def test_copy_assets_creates_directories_and_skips_unchanged(site_engine):
+    os.makedirs(os.path.join(site_engine.root_path, "assets", "js"))
+    write_source(site_engine, "assets/js/app.js", "alert(1)")
+    site_engine.copy_assets()
+    assert read_dist(site_engine, "assets/js/app.js") == "alert(1)"
+    site_engine.copy_assets()
+    assert site_engine.output.written == 1
+    assert site_engine.output.unchanged == 1
+
+
+def test_part_cache_busting_writes_fingerprinted_assets(tmp_path):
+    engine = BlogEngine(str(tmp_path), "", "Test Blog", cache_busting_strategy="part")
+    write_asset(engine, "style.css", "body{}")
+    write_asset(engine, "logo.png", "png")
+    engine.add_asset_hashes()
+    url = engine.get_asset_url("style.css")
+    assert url == "/assets/style.aa676972bbd2b68e94ef8e91e81d20be.css"
+    assert read_dist(engine, url[1:]) == "body{}"
+
+    # the fingerprinted copy must not be hashed and fingerprinted itself
+    engine.add_asset_hashes()
+    assert sorted(engine.asset_hash) == ["logo.png", "style.css"]
+
+
+def test_add_asset_hashes_forgets_deleted_assets(tmp_path):
+    engine = BlogEngine(str(tmp_path), "", "Test Blog", cache_busting_strategy="part")
+    write_asset(engine, "a.css", "a{}")
+    path = write_asset(engine, "b.css", "b{}")
+    engine.add_asset_hashes()
+    os.remove(path)
+    os.remove(
+        os.path.join(os.path.dirname(path), engine.get_fingerprinted_path("b.css"))
+    )
+    engine.add_asset_hashes()
+    assert sorted(engine.asset_hash) == ["a.css"]
+
+
+def test_write_fingerprinted_assets_manifest(tmp_path):
+    engine = BlogEngine(str(tmp_path), "", "Test Blog")
+    write_asset(engine, "style.css", "body{}")
+    engine.add_asset_hashes(algorithm="blake2b")
+    engine.write_fingerprinted_assets(manifest_path="assets/manifest.json")
+    fingerprinted = engine.get_fingerprinted_path("style.css")
+    assert json.loads(read_dist(engine, "assets/manifest.json")) == {
+        "style.css": fingerprinted
+    }
+    assert read_dist(engine, "assets/" + fingerprinted) == "body{}"
+
+
+def test_generate_archive_with_pagination(site_engine):
+    site_engine.cm.add_posts(
+        [
+            make_post(
+                site_engine, "", title="Post %d" % idx, pubdate="2020-01-0%d" % idx
+            )
+            for idx in range(1, 6)
+        ]
+    )
+    site_engine.generate_archive(per_page=2)
+    first = read_dist(site_engine, "archive.html")
+    assert "Post 5" in first and "Post 4" in first and "Post 3" not in first
+    assert 'href="//localhost/archive/page/2" class="next"' in first
+    second = read_dist(site_engine, "archive/page/2.html")
+    assert "Post 3" in second and "Post 2" in second
+    assert 'href="//localhost/archive" class="prev"' in second
+    assert 'href="//localhost/archive/page/3" class="next"' in second
+    third = read_dist(site_engine, "archive/page/3.html")
+    assert "Post 1" in third and "Page 3 of 3" in third
+    assert 'class="next"' not in third
+
+
+def test_generate_index_with_pagination(site_engine):
+    site_engine.cm.add_posts(
+        [make_post(site_engine, "", title="Post %d" % idx) for idx in range(3)]
+    )
+    site_engine.generate_index(num_posts=2, paginate=True)
+    assert 'href="//localhost/page/2"' in read_dist(site_engine, "index.html")
+    assert 'href="//localhost/" class="prev"' in read_dist(site_engine, "page/2.html")
+
+
+def test_generate_index_with_pagination_and_empty_root_url(site_engine):
+    engine = BlogEngine(site_engine.root_path, "", "Test Blog")
+    engine.cm.add_posts(
+        [make_post(engine, "", title="Post %d" % idx) for idx in range(3)]
+    )
+    engine.generate_index(num_posts=2, paginate=True)
+    assert 'href="/" class="prev"' in read_dist(engine, "page/2.html")
+
+
+def test_generate_tags_with_pagination(site_engine):
+    site_engine.cm.add_posts(
+        [
+            make_post(site_engine, "", title="Post %d" % idx, tags="Foo")
+            for idx in range(3)
+        ]
+    )
+    site_engine.generate_tags(per_page=2)
+    assert "Page 2 of 2" in read_dist(site_engine, "tags/foo/page/2.html")
+
+
+def test_generate_date_archives(site_engine):
+    site_engine.cm.add_posts(
+        [
+            make_post(site_engine, "", title="A", pubdate="2023-05-01 00:00 UTC"),
+            make_post(site_engine, "", title="B", pubdate="2024-05-01 00:00 UTC"),
+            make_post(site_engine, "", title="C", pubdate="2024-06-01 00:00 UTC"),
+        ]
+    )
+    site_engine.generate_date_archives()
+    dist = os.path.join(site_engine.root_path, "dist")
+    assert sorted(os.listdir(dist)) == ["2023", "2024"]
+    assert sorted(os.listdir(os.path.join(dist, "2024"))) == ["05", "06", "index.html"]
+    year = read_dist(site_engine, "2024/index.html")
+    assert "posts/b" in year and "posts/c" in year and "posts/a" not in year
+    month = read_dist(site_engine, "2024/05/index.html")
+    assert "posts/b" in month and "posts/c" not in month
+
+
+def test_generate_date_archives_with_pagination(site_engine):
+    site_engine.cm.add_posts(
+        [
+            make_post(site_engine, "", title=title, pubdate="2024-05-01 00:00 UTC")
+            for title in "ABC"
+        ]
+    )
+    site_engine.generate_date_archives(months=False, per_page=2)
+    assert 'href="//localhost/2024/page/2"' in read_dist(site_engine, "2024/index.html")
+    assert "Page 2 of 2" in read_dist(site_engine, "2024/page/2.html")
+
+
+def test_scan_posts(site_engine):
+    write_source(
+        site_engine, "posts/b.md", "# B\npubdate: 2020-01-02 00:00 UTC\n\nBody"
+    )
+    write_source(
+        site_engine, "posts/a.md", "# A\npubdate: 2020-01-01 00:00 UTC\ntags: X\n\nB"
+    )
+    headers = site_engine.scan_posts()
+    assert [(header.slug, header.tags) for header in headers] == [
+        ("a", ("X",)),
+        ("b", ()),
+    ]
+    # scanning doesn't add posts
+    assert site_engine.posts == []
+
+
+def test_evict_bodies(site_engine):
+    site_engine.evict_bodies = True
+    site_engine.cm.add_posts([make_post(site_engine, "World")])
+    site_engine.generate_posts()
+    assert "<p>World</p>" in read_dist(site_engine, "posts/hello.html")
+    post = site_engine.posts[0]
+    assert post.get_unrendered() == [("body", "World"), ("excerpt", "World")]
+    site_engine.generate_index()
+    assert "<p>World</p>" in read_dist(site_engine, "index.html")
+
+
+def test_generate_sitemap(site_engine):
+    page_path = write_source(site_engine, "pages/about.md", "# About\n\nAbout me")
+    os.utime(page_path, (0, 1600000000))
+    site_engine.add_pages()
+    site_engine.cm.add_posts(
+        [
+            make_post(site_engine, "", title="A", pubdate="2020-01-01 00:00 UTC"),
+            make_post(
+                site_engine, "", title="B", pubdate="2020-02-01 00:00 UTC", tags="X"
+            ),
+        ]
+    )
+    site_engine.generate_sitemap()
+    sitemap = read_dist(site_engine, "sitemap.xml")
+    assert (
+        "<url><loc>http://localhost</loc><lastmod>2020-02-01</lastmod>"
+        "<changefreq>daily</changefreq></url>"
+    ) in sitemap
+    assert "<loc>http://localhost/about</loc><lastmod>2020-09-1" in sitemap
+    assert "<loc>http://localhost/tags/x</loc><lastmod>2020-02-01</lastmod>" in sitemap
+    assert "<loc>http://localhost/posts/a</loc><lastmod>2020-01-01</lastmod>" in sitemap
+
+
+def test_generate_sharded_sitemap(site_engine):
+    site_engine.cm.add_posts(
+        [
+            make_post(
+                site_engine, "", title=title, pubdate="2020-01-0%d 00:00 UTC" % day
+            )
+            for day, title in enumerate("ABC", start=1)
+        ]
+    )
+    site_engine.generate_sitemap(max_urls=3, compress=True)
+    dist = os.path.join(site_engine.root_path, "dist")
+    assert sorted(os.listdir(dist)) == [
+        "sitemap-1.xml.gz",
+        "sitemap-2.xml.gz",
+        "sitemap_index.xml.gz",
+    ]
+    with gzip.open(os.path.join(dist, "sitemap_index.xml.gz"), "rt") as file:
+        index = file.read()
+    assert (
+        "<sitemap><loc>http://localhost/sitemap-1.xml.gz</loc>"
+        "<lastmod>2020-01-03</lastmod></sitemap>"
+        "<sitemap><loc>http://localhost/sitemap-2.xml.gz</loc>"
+        "<lastmod>2020-01-01</lastmod></sitemap>"
+    ) in index
+    with gzip.open(os.path.join(dist, "sitemap-2.xml.gz"), "rt") as file:
+        assert file.read().count("<url>") == 1
+
+
+def test_profile_is_saved_as_json(site_engine, tmp_path):
+    profile_path = str(tmp_path / "profile.json")
+    engine = BlogEngine(
+        site_engine.root_path, "//localhost", "Test Blog", profile=profile_path
+    )
+    engine.cm.add_posts([make_post(engine, "World")])
+    engine.generate_posts()
+    engine.generate_index()
+    engine.finish()
+    with open(profile_path) as file:
+        profile = json.load(file)
+    assert set(profile["phases"]) == {"generate_posts", "generate_index"}
+    assert profile["timers"]["markdown"]["calls"] == 1
+    assert {output["path"] for output in profile["slowest_outputs"]} == {
+        "posts/hello.html",
+        "index.html",
+    }
+
+
+def test_template_cache_is_reused_between_builds(site_engine):
+    root_path = site_engine.root_path
+    engine = BlogEngine(
+        root_path, "//localhost", "Test Blog", cache_dir=".cache", template_cache=True
+    )
+    names = engine.precompile_templates()
+    assert "post.html.jinja" in names
+    jinja_cache_dir = os.path.join(root_path, ".cache", "jinja")
+    cached = sorted(os.listdir(jinja_cache_dir))
+    assert len(cached) == len(names)
+
+    engine = BlogEngine(
+        root_path, "//localhost", "Test Blog", cache_dir=".cache", template_cache=True
+    )
+    engine.cm.add_posts([make_post(engine, "", title="a")])
+    engine.generate_posts()
+    assert sorted(os.listdir(jinja_cache_dir)) == cached
+    assert "a" in read_dist(engine, "posts/a.html")
+
+
+def test_precompile_templates_reports_every_error(site_engine):
+    templates_dir = os.path.join(site_engine.root_path, "templates")
+    for name in ("post.html.jinja", "page.html.jinja"):
+        with open(os.path.join(templates_dir, name), "w") as file:
+            file.write("{% if %}")
+    with pytest.raises(TemplateError) as excinfo:
+        site_engine.precompile_templates()
+    assert sorted(excinfo.value.errors) == ["page.html.jinja", "post.html.jinja"]
+
+
+def test_cached_fragment_renders_once_per_dependencies(site_engine):
+    with open(
+        os.path.join(site_engine.root_path, "templates", "post.html.jinja"), "w"
+    ) as file:
+        file.write(
+            "{% call cached_fragment('first', tags) %}{{ post.title }}{% endcall %}"
+            "{% call cached_fragment('own', post) %}{{ post.title }}{% endcall %}"
+        )
+    site_engine.cm.add_posts([make_post(site_engine, "", title=t) for t in "ab"])
+    site_engine.generate_posts()
+    assert read_dist(site_engine, "posts/a.html") == "aa"
+    assert read_dist(site_engine, "posts/b.html") == "ab"
+
+
+def test_render_key_includes_custom_filters_and_helper_source(site_engine, tmp_path):
+    helper_path = tmp_path / "helpers.py"
+    helper_path.write_text("def shout(value):\n    return value.upper()\n")
+    namespace = {}
+    exec(compile(helper_path.read_text(), str(helper_path), "exec"), namespace)
+    kwargs = {"post": make_post(site_engine, "")}
+
+    key = site_engine._get_render_key("post.html.jinja", kwargs)
+    assert site_engine._get_render_key("post.html.jinja", kwargs) == key
+    site_engine.jinja.filters["shout"] = namespace["shout"]
+    filter_key = site_engine._get_render_key("post.html.jinja", kwargs)
+    assert filter_key != key
+
+    helper_path.write_text("def shout(value):\n    return value.upper() + '!'\n")
+    site_engine.reload([])
+    assert site_engine._get_render_key("post.html.jinja", kwargs) != filter_key
+
+
+def test_render_key_changes_with_tags(site_engine):
+    kwargs = {"post": make_post(site_engine, "")}
+    key = site_engine._get_render_key("post.html.jinja", kwargs)
+    site_engine.cm.add_posts([make_post(site_engine, "", title="a", tags="new")])
+    assert site_engine._get_render_key("post.html.jinja", kwargs) != key
+
+
+def test_pages_are_rendered_again_when_custom_globals_may_read_content(site_engine):
+    templates_dir = os.path.join(site_engine.root_path, "templates")
+    with open(os.path.join(templates_dir, "page.html.jinja"), "w") as file:
+        file.write("recent: {{ recent_titles() }}")
+    site_engine.jinja.globals["recent_titles"] = lambda: ", ".join(
+        post.title for post in site_engine.get_posts(num=3)
+    )
+    site_engine.cm.add_pages([site_engine.cm.Page.from_string("# About\n\nMe")])
+    site_engine.cm.add_posts([make_post(site_engine, "", title="first")])
+    site_engine.generate_pages()
+    assert read_dist(site_engine, "about.html") == "recent: first"
+
+    site_engine.cm.add_posts(
+        [make_post(site_engine, "", title="second", pubdate="2021-01-01 00:00 UTC")]
+    )
+    site_engine.generate_pages()
+    assert read_dist(site_engine, "about.html") == "recent: second, first"
+
+
+def test_markdown_of_posts_not_rendered_is_kept_in_cache(site_engine, monkeypatch):
+    root_path = site_engine.root_path
+    write_source(site_engine, "posts/a.md", "# A\npubdate: 2020-01-02\n\nA")
+    write_source(site_engine, "posts/b.md", "# B\npubdate: 2020-01-01\n\nB")
+
+    def build():
+        engine = BlogEngine(root_path, "//localhost", "Test Blog", cache_dir=".cache")
+        engine.add_posts()
+        engine.add_asset_hashes()
+        engine.generate_posts()
+        engine.finish()
+
+    build()
+    write_source(site_engine, "posts/a.md", "# A\npubdate: 2020-01-02\n\nChanged")
+    build()
+
+    # changing an asset changes the globals, so every post is rendered again,
+    # but the markdown of b should still be cached
+    rendered = []
+    render_markdown = russell.content.render_markdown
+    monkeypatch.setattr(
+        russell.content,
+        "render_markdown",
+        lambda text: rendered.append(text) or render_markdown(text),
+    )
+    write_asset(site_engine, "style.css", "body{}")
+    build()
+    assert "B" in read_dist(site_engine, "posts/b.html")
+    assert rendered == []
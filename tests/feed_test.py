@@ -1,5 +1,10 @@
+import os.path
+from datetime import datetime, timezone
+from xml.etree import ElementTree
+
+import russell.feed
 from russell.feed import get_rss_feed
-from russell.content import Post
+from russell.content import Post, Tag
 
 
 def get_rss(engine, **kwargs):
@@ -38,3 +43,117 @@ def test_full_body_is_present_if_only_excerpt_is_true(engine):
     rss = get_rss(engine, only_excerpt=False)
     assert "Read the full article at" not in rss
     assert "Very long post" in rss
+
+
+def read_feed(engine, path):
+    with open(os.path.join(engine.root_path, "dist", path)) as file:
+        return file.read()
+
+
+def add_posts(engine):
+    engine.cm.add_posts(
+        [
+            Post.from_string(
+                "# Post %d\npubdate: 2020-01-0%d 00:00 UTC\ntags: %s\n\nBody %d & more"
+                % (idx, idx, "Foo" if idx % 2 else "Bar", idx)
+            )
+            for idx in range(1, 5)
+        ]
+    )
+
+
+def test_generate_rss_streams_a_valid_feed(site_engine):
+    add_posts(site_engine)
+    site_engine.generate_rss(only_excerpt=False)
+    rss = read_feed(site_engine, "rss.xml")
+    channel = ElementTree.fromstring(rss).find("channel")
+    assert channel.find("title").text == "Test Blog"
+    assert channel.find("lastBuildDate").text == "Sat, 04 Jan 2020 00:00:00 +0000"
+    items = channel.findall("item")
+    assert [item.find("title").text for item in items] == [
+        "Post 4",
+        "Post 3",
+        "Post 2",
+        "Post 1",
+    ]
+    assert items[0].find("description").text == "<p>Body 4 &amp; more</p>"
+    assert items[0].find("link").text == "http://localhost/posts/post-4"
+
+
+def test_generate_feed_with_max_entries_and_tag(site_engine):
+    add_posts(site_engine)
+    site_engine.generate_feed(
+        "tags/foo.xml", feed_format="atom", max_entries=1, tag="foo"
+    )
+    feed = ElementTree.fromstring(read_feed(site_engine, "tags/foo.xml"))
+    atom = "{http://www.w3.org/2005/Atom}"
+    assert feed.find(atom + "title").text == "Test Blog - Foo"
+    entries = feed.findall(atom + "entry")
+    assert [entry.find(atom + "title").text for entry in entries] == ["Post 3"]
+    assert entries[0].find(atom + "published").text == "2020-01-03T00:00:00+00:00"
+
+
+def test_unchanged_feed_is_not_rewritten(site_engine):
+    add_posts(site_engine)
+    site_engine.generate_rss()
+    path = os.path.join(site_engine.root_path, "dist", "rss.xml")
+    os.utime(path, (0, 0))
+    site_engine.generate_rss()
+    assert os.path.getmtime(path) == 0
+
+
+def test_generate_feeds_renders_each_entry_once(site_engine, monkeypatch):
+    add_posts(site_engine)
+    site_engine.generate_feed("foo.xml", tag="foo", max_entries=1)
+    separate_feed = read_feed(site_engine, "foo.xml")
+
+    calls = []
+    render_entry = russell.feed.render_entry
+    monkeypatch.setattr(
+        russell.feed,
+        "render_entry",
+        lambda post, *args: calls.append(post) or render_entry(post, *args),
+    )
+    site_engine.generate_feeds(max_entries=1)
+    assert read_feed(site_engine, "tags/foo.xml") == separate_feed.replace(
+        "/foo.xml", "/tags/foo.xml"
+    )
+    assert "Post 4" in read_feed(site_engine, "tags/bar.xml")
+    assert "Post 4" in read_feed(site_engine, "rss.xml")
+    # post 4 (bar) and post 3 (foo) fill up every feed
+    assert [post.title for post in calls] == ["Post 4", "Post 3"]
+
+
+def test_generate_feeds_lists_post_once_per_slug(site_engine):
+    site_engine.cm.add_posts(
+        [
+            Post(
+                "Test Post",
+                "Body",
+                pubdate=datetime(2020, 1, 1, tzinfo=timezone.utc),
+                tags=[Tag("C++"), Tag("C#")],
+            )
+        ]
+    )
+    site_engine.generate_feeds()
+    rss = read_feed(site_engine, "tags/c.xml")
+    assert len(ElementTree.fromstring(rss).findall("channel/item")) == 1
+
+
+def test_atom_feed_of_tag_without_public_posts_has_updated(site_engine):
+    site_engine.cm.add_posts(
+        [
+            Post(
+                "Secret Post",
+                "Body",
+                public=False,
+                pubdate=datetime(2020, 1, 1, tzinfo=timezone.utc),
+                tags=[Tag("Secret")],
+            )
+        ]
+    )
+    site_engine.generate_feeds(feed_format="atom")
+    feed = ElementTree.fromstring(read_feed(site_engine, "tags/secret.xml"))
+    atom = "{http://www.w3.org/2005/Atom}"
+    assert feed.find(atom + "entry") is None
+    assert feed.find(atom + "updated").text == "1970-01-01T00:00:00+00:00"
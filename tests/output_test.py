@@ -0,0 +1,145 @@
+import os
+
+from russell.output import OutputWriter
+
+
+def test_write_creates_directories_and_file(tmp_path):
+    writer = OutputWriter(str(tmp_path))
+    path = str(tmp_path / "a" / "b.html")
+    assert writer.write(path, "hello") is True
+    with open(path) as file:
+        assert file.read() == "hello"
+    assert os.listdir(str(tmp_path / "a")) == ["b.html"]
+
+
+def test_write_leaves_unchanged_files_alone(tmp_path):
+    writer = OutputWriter(str(tmp_path))
+    path = str(tmp_path / "b.html")
+    writer.write(path, "hello")
+    os.utime(path, (0, 0))
+    assert writer.write(path, b"hello") is False
+    assert os.path.getmtime(path) == 0
+    assert writer.write(path, "hellO") is True
+    assert os.path.getmtime(path) != 0
+
+
+def test_summary_counts_files(tmp_path):
+    writer = OutputWriter(str(tmp_path))
+    writer.write(str(tmp_path / "a"), "a")
+    writer.write(str(tmp_path / "a"), "a")
+    writer.write(str(tmp_path / "b"), "b")
+    (tmp_path / "c").write_text("c")
+    writer.skip(str(tmp_path / "c"))
+    writer.remove(str(tmp_path / "b"))
+    assert writer.summary() == "2 files written, 2 unchanged, 1 removed"
+
+
+def test_manifest_records_written_and_skipped_files(tmp_path):
+    writer = OutputWriter(str(tmp_path))
+    writer.write(str(tmp_path / "a" / "b.html"), "hello")
+    with open(str(tmp_path / "c.css"), "w") as file:
+        file.write("body{}")
+    writer.skip(str(tmp_path / "c.css"))
+    assert sorted(writer.manifest) == ["a/b.html", "c.css"]
+    assert writer.manifest["a/b.html"]["size"] == 5
+    assert writer.manifest["a/b.html"]["sha1"] == (
+        "aaf4c61ddcc5e8a2dabede0f3b482cd9aea9434d"
+    )
+
+
+def test_diff_against_previous_manifest(tmp_path):
+    manifest_path = str(tmp_path / "manifest.json")
+    dist = tmp_path / "dist"
+    writer = OutputWriter(str(dist), manifest_path)
+    writer.write(str(dist / "same"), "same")
+    writer.write(str(dist / "changed"), "old")
+    writer.write(str(dist / "removed"), "removed")
+    writer.save()
+
+    writer = OutputWriter(str(dist), manifest_path)
+    writer.write(str(dist / "same"), "same")
+    writer.write(str(dist / "changed"), "new")
+    writer.write(str(dist / "added"), "added")
+    assert writer.diff() == {
+        "added": ["added"],
+        "changed": ["changed"],
+        "removed": ["removed"],
+    }
+
+
+def test_prune_removes_files_not_in_manifest(tmp_path):
+    (tmp_path / "old").mkdir()
+    (tmp_path / "old" / "post.html").write_text("old")
+    writer = OutputWriter(str(tmp_path))
+    writer.write(str(tmp_path / "new.html"), "new")
+    writer.prune()
+    assert os.listdir(str(tmp_path)) == ["new.html"]
+    assert writer.removed == 1
+
+
+def test_copy_skips_identical_files(tmp_path):
+    src = tmp_path / "src.css"
+    src.write_text("body{}")
+    writer = OutputWriter(str(tmp_path / "dist"))
+    dest = str(tmp_path / "dist" / "assets" / "src.css")
+    assert writer.copy(str(src), dest) is True
+    assert os.stat(dest).st_mtime_ns == os.stat(str(src)).st_mtime_ns
+    assert writer.copy(str(src), dest) is False
+
+    src.write_text("html{}")
+    assert writer.copy(str(src), dest) is True
+    with open(dest) as file:
+        assert file.read() == "html{}"
+
+
+def test_copy_with_hard_link(tmp_path):
+    src = tmp_path / "src.css"
+    src.write_text("body{}")
+    writer = OutputWriter(str(tmp_path / "dist"))
+    dest = str(tmp_path / "dist" / "src.css")
+    writer.copy(str(src), dest, link="hard")
+    assert os.path.samefile(str(src), dest)
+    assert writer.copy(str(src), dest, link="hard") is False
+
+
+def test_copy_with_reflink(tmp_path):
+    src = tmp_path / "src.css"
+    src.write_text("body{}")
+    writer = OutputWriter(str(tmp_path / "dist"))
+    dest = str(tmp_path / "dist" / "src.css")
+    writer.copy(str(src), dest, link="reflink")
+    with open(dest) as file:
+        assert file.read() == "body{}"
+    assert writer.manifest["src.css"]["size"] == 6
+
+
+def test_open_writes_in_pieces_and_skips_unchanged_files(tmp_path):
+    writer = OutputWriter(str(tmp_path))
+    path = str(tmp_path / "a" / "feed.xml")
+    with writer.open(path) as file:
+        file.write("hello ")
+        file.write(b"world")
+    with open(path) as file:
+        assert file.read() == "hello world"
+    os.utime(path, (0, 0))
+    with writer.open(path) as file:
+        file.write("hello world")
+    assert os.path.getmtime(path) == 0
+    assert os.listdir(str(tmp_path / "a")) == ["feed.xml"]
+    assert (writer.written, writer.unchanged) == (1, 1)
+    assert writer.manifest["a/feed.xml"]["size"] == 11
+
+
+def test_open_leaves_file_alone_on_error(tmp_path):
+    writer = OutputWriter(str(tmp_path))
+    path = str(tmp_path / "feed.xml")
+    writer.write(path, "old")
+    try:
+        with writer.open(path) as file:
+            file.write("new")
+            raise RuntimeError()
+    except RuntimeError:
+        pass
+    assert os.listdir(str(tmp_path)) == ["feed.xml"]
+    with open(path) as file:
+        assert file.read() == "old"
@@ -0,0 +1,49 @@
+from russell.profiling import BuildProfiler
+
+
+def test_nested_phases_count_towards_outer_phase():
+    profiler = BuildProfiler(enabled=True)
+    with profiler.phase("outer"):
+        with profiler.phase("inner"):
+            pass
+    with profiler.phase("outer"):
+        pass
+    assert list(profiler.phases) == ["outer"]
+    assert profiler.phases["outer"].calls == 2
+
+
+def test_slowest_outputs_and_templates():
+    profiler = BuildProfiler(enabled=True)
+    profiler.record_output("a.html", "post.html.jinja", 0.1)
+    profiler.record_output("b.html", "post.html.jinja", 0.3)
+    profiler.record_output("c.html", "page.html.jinja", 0.2)
+    with profiler.timer("markdown"):
+        pass
+    profiler.stop()
+    data = profiler.to_dict(top=2)
+    assert [output["path"] for output in data["slowest_outputs"]] == [
+        "b.html",
+        "c.html",
+    ]
+    assert data["slowest_templates"][0] == {
+        "template": "post.html.jinja",
+        "seconds": 0.4,
+        "calls": 2,
+    }
+    assert data["timers"]["markdown"]["calls"] == 1
+    assert "slowest outputs:" in profiler.summary()
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = BuildProfiler()
+    with profiler.phase("phase"), profiler.timer("timer"):
+        profiler.record_output("a.html", "post.html.jinja", 0.1)
+    assert (profiler.phases, profiler.timers, profiler.outputs) == ({}, {}, [])
+
+
+def test_summary_before_stop_reports_time_so_far():
+    profiler = BuildProfiler(enabled=True)
+    with profiler.phase("add_posts"):
+        pass
+    assert profiler.to_dict()["total"] >= 0
+    assert "add_posts" in profiler.summary()